@@ -3,16 +3,38 @@ from alpaca.data.requests import CryptoBarsRequest
 from alpaca.data.timeframe import TimeFrame, TimeFrameUnit
 import datetime
 from dateutil.relativedelta import relativedelta
-from typing import List
-from data_types import BarData, TimeframeString
+from typing import Iterator, List, Optional, Tuple
+from data_types import BarData, BarSeries, TimeframeString
+from requests.adapters import HTTPAdapter
+from profiler import profiler
+import numpy as np
+import pandas as pd
 
-# No keys required for crypto data
-client = CryptoHistoricalDataClient()
+# Bars per request when fetching history, Alpaca returns at most 10000 per response
+PAGE_SIZE = 10000
+
+# Shared by every AlpacaInterface, created by get_client on first use
+client: Optional[CryptoHistoricalDataClient] = None
+
+
+def get_client() -> CryptoHistoricalDataClient:
+    global client
+    if client is None:
+        # No keys required for crypto data
+        client = CryptoHistoricalDataClient()
+    return client
+
+
+def set_connection_pool_size(size: int):
+    # The SDK sends everything through one requests.Session, whose pool keeps 10 connections by default
+    adapter = HTTPAdapter(pool_connections=size, pool_maxsize=size)
+    get_client()._session.mount("https://", adapter)
 
 
 class AlpacaInterface:
-    def __init__(self, symbol, timeframe: TimeframeString, lookbackPeriod=0):
+    def __init__(self, symbol, timeframe: TimeframeString, lookbackPeriod=0, data_client: Optional[CryptoHistoricalDataClient] = None):
         self.symbol = symbol
+        self.client = data_client or get_client()
         (self.timeframe, self.intervalMs) = self._parse_timeframe(timeframe)
         self.lookbackPeriod = lookbackPeriod
         self.timeframeString: TimeframeString = timeframe
@@ -78,14 +100,72 @@ class AlpacaInterface:
                                       (self.lookbackPeriod-1))
         return rounded
 
-    def fetch(self) -> List[BarData]:
+    def get_page_length(self) -> datetime.timedelta:
+        """Time span of one page, about PAGE_SIZE bars."""
+        if not self.intervalMs:
+            return datetime.timedelta(days=30 * PAGE_SIZE)
+        return datetime.timedelta(milliseconds=self.intervalMs * PAGE_SIZE)
+
+    @profiler.timed()
+    def fetch_page(self, start: datetime.datetime, end: datetime.datetime) -> BarSeries:
+        """
+        Bars from start (inclusive) to end (exclusive). Alpaca includes a bar
+        opening at end, it is dropped so adjacent pages don't share it.
+        """
+        request_params = CryptoBarsRequest(
+            symbol_or_symbols=[self.symbol],
+            timeframe=self.timeframe,
+            start=start,
+            end=end,
+        )
+        with profiler.stage("get_crypto_bars"):
+            bars = self.client.get_crypto_bars(request_params)
+        try:
+            bars = bars[self.symbol]
+        except KeyError:
+            # Nothing traded in the page
+            return BarSeries.empty()
+        # Straight into columns, without a dict per bar in between
+        timestamps = pd.DatetimeIndex([bar.timestamp for bar in bars])
+        timestamps = timestamps.tz_localize('UTC') if timestamps.tz is None else timestamps.tz_convert('UTC')
+
+        def column(name):
+            return np.fromiter((getattr(bar, name) for bar in bars), dtype=np.float64, count=len(bars))
+        page = BarSeries(timestamps.as_unit('ns').asi8, column('open'), column('high'),
+                         column('low'), column('close'), column('volume'))
+        end_timestamp = pd.Timestamp(end)
+        end_timestamp = end_timestamp.tz_localize('UTC') if end_timestamp.tz is None else end_timestamp
+        return page[:int(np.searchsorted(page.timestamp, end_timestamp.value))]
+
+    def fetch_pages(self, start: Optional[datetime.datetime] = None) -> Iterator[Tuple[datetime.datetime, BarSeries]]:
+        """
+        Yields every bar from start onwards, or since 2021 by default, one time
+        chunked page at a time as (page end, bars), so memory use doesn't grow
+        with the history. Pages may be empty.
+        """
+        page_start = start or datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+        if page_start.tzinfo is None:
+            page_start = page_start.replace(tzinfo=datetime.timezone.utc)
+        end = datetime.datetime.now(datetime.timezone.utc)
+        page_length = self.get_page_length()
+        while page_start < end:
+            page_end = min(page_start + page_length, end)
+            yield page_end, self.fetch_page(page_start, page_end)
+            page_start = page_end
+
+    # The last lookbackPeriod bars, every bar from start onwards if given
+    @profiler.timed()
+    def fetch(self, start: Optional[datetime.datetime] = None) -> List[BarData]:
+        if start or not self.lookbackPeriod:
+            return BarSeries.concatenate([bars for _, bars in self.fetch_pages(start)]).to_bar_dicts()
         request_params = CryptoBarsRequest(
             symbol_or_symbols=[self.symbol],
             timeframe=self.timeframe,
-            start=self._get_start_date() if self.lookbackPeriod else datetime.datetime(2021, 1, 1),
-            limit=self.lookbackPeriod if self.lookbackPeriod else 20000000
+            start=self._get_start_date(),
+            limit=self.lookbackPeriod
         )
-        bars = client.get_crypto_bars(request_params)
+        with profiler.stage("get_crypto_bars"):
+            bars = self.client.get_crypto_bars(request_params)
         data: List[BarData] = []
         for bar in bars[self.symbol]:
             data.append({
@@ -0,0 +1,175 @@
+from dataclasses import dataclass
+from typing import Dict, List, Optional, TypedDict
+from data_types import Bars, BarSeries
+from profiler import profiler
+import pandas as pd
+import numpy as np
+import json
+import os
+
+NANOSECONDS_PER_YEAR = 365 * 24 * 3600 * 1_000_000_000
+# Keys of the dict get_stats returns
+STAT_NAMES = ('initial_cash', 'final_equity', 'total_return_pct', 'max_drawdown_pct', 'sharpe',
+              'trades', 'win_rate_pct', 'profit_factor', 'fees', 'exposure_pct')
+
+
+@dataclass
+class BacktestConfig:
+    # Fraction of the traded notional paid on every fill, 0.001 = 0.1%
+    fee_rate: float = 0.001
+    # Fraction the fill price moves against the order, 0.0005 = 0.05%
+    slippage: float = 0.0005
+    initial_cash: float = 10000.0
+
+
+class Trade(TypedDict):
+    # ns since epoch, bars are filled at their open
+    entry_timestamp: int
+    exit_timestamp: int
+    # 1 long, -1 short
+    side: int
+    quantity: float
+    entry_price: float
+    exit_price: float
+    fees: float
+    pnl: float
+    # pnl relative to the equity the trade was opened with
+    return_pct: float
+
+
+@dataclass
+class BacktestResult:
+    timestamps: np.ndarray
+    # Position held during every bar, as a fraction of equity
+    positions: np.ndarray
+    # Marked to market at every close
+    equity: np.ndarray
+    trades: List[Trade]
+    stats: Dict[str, float]
+
+    def to_dict(self):
+        return {
+            'stats': self.stats,
+            'trades': self.trades,
+            'equity': {'timestamp': self.timestamps.tolist(), 'equity': self.equity.tolist()},
+        }
+
+    def write(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, "w") as file:
+            json.dump(self.to_dict(), file)
+
+
+def get_interval(timestamps: np.ndarray) -> int:
+    """Typical ns between two bars, gaps in the data don't skew it."""
+    return int(np.median(np.diff(timestamps))) if len(timestamps) > 1 else 0
+
+
+def align(values, timestamps: np.ndarray, target_timestamps: np.ndarray, fill=None) -> np.ndarray:
+    """
+    Maps per-bar values of one timeframe onto the bars of another. A target bar
+    gets the value of the last source bar that had closed by the time it
+    closes, so higher timeframe values never leak into the bars they contain.
+    Bars before the first close get `fill`.
+    """
+    close_times = timestamps + get_interval(timestamps)
+    target_close_times = target_timestamps + get_interval(target_timestamps)
+    indices = np.searchsorted(close_times, target_close_times, side='right') - 1
+    return np.where(indices >= 0, np.asarray(values)[np.maximum(indices, 0)], fill)
+
+
+def hold_until(entries: np.ndarray, exits: np.ndarray) -> np.ndarray:
+    """
+    Target positions from entry and exit events: a non-zero entry opens that
+    position, which is held until the next exit or a different entry.
+    """
+    targets = pd.Series(np.where(entries != 0, entries, np.where(exits, 0, np.nan)))
+    return targets.ffill().fillna(0).to_numpy()
+
+
+@profiler.timed()
+def run_backtest(bars: Bars, signals: np.ndarray, config: Optional[BacktestConfig] = None, previous_signal=0.0) -> BacktestResult:
+    """
+    Simulates trading a target position per bar, between -1 (all-in short) and
+    1 (all-in long). A signal is known at its bar's close and filled at the next
+    bar's open, paying slippage and fees on every fill. previous_signal is the
+    signal of the bar before the first one, filled at the first bar's open.
+    """
+    bars = BarSeries.coerce(bars)
+    config = config or BacktestConfig()
+    signals = np.nan_to_num(np.asarray(signals, dtype=np.float64))
+    positions = np.zeros(len(bars))
+    if len(bars):
+        positions[0] = previous_signal
+    positions[1:] = signals[:-1]
+    # Bars where the held position changes, the only ones that need stepping through
+    changes = np.flatnonzero(np.diff(positions, prepend=0) != 0)
+
+    equity = config.initial_cash
+    trades: List[Trade] = []
+    trade: Optional[Trade] = None
+    entry_equity = equity
+    # Equity of every bar is base + quantity * (close - reference), constant between changes
+    bases, quantities, references = [equity], [0.0], [0.0]
+    for i in changes:
+        price = bars.open[i]
+        if trade:
+            side = trade['side']
+            exit_price = price * (1 - config.slippage * side)
+            exit_fee = config.fee_rate * trade['quantity'] * exit_price
+            equity += side * trade['quantity'] * \
+                (exit_price - trade['entry_price']) - exit_fee
+            trade['exit_timestamp'] = int(bars.timestamp[i])
+            trade['exit_price'] = float(exit_price)
+            trade['fees'] += float(exit_fee)
+            trade['pnl'] = float(equity - entry_equity)
+            trade['return_pct'] = trade['pnl'] / entry_equity * 100
+            trades.append(trade)
+            trade = None
+        side = int(np.sign(positions[i]))
+        quantity = 0.0
+        entry_price = 0.0
+        if side:
+            entry_price = price * (1 + config.slippage * side)
+            quantity = equity * abs(positions[i]) / entry_price
+            entry_fee = config.fee_rate * quantity * entry_price
+            entry_equity = equity
+            equity -= entry_fee
+            trade = {'entry_timestamp': int(bars.timestamp[i]), 'exit_timestamp': 0, 'side': side,
+                     'quantity': float(quantity), 'entry_price': float(entry_price), 'exit_price': 0.0,
+                     'fees': float(entry_fee), 'pnl': 0.0, 'return_pct': 0.0}
+        bases.append(equity)
+        quantities.append(side * quantity)
+        references.append(entry_price)
+
+    lengths = np.diff(np.concatenate(([0], changes, [len(bars)])))
+    equity_curve = np.repeat(bases, lengths) + np.repeat(quantities, lengths) * \
+        (bars.close - np.repeat(references, lengths))
+    return BacktestResult(bars.timestamp, positions, equity_curve, trades,
+                          get_stats(bars.timestamp, positions, equity_curve, trades, config))
+
+
+def get_stats(timestamps: np.ndarray, positions: np.ndarray, equity: np.ndarray, trades: List[Trade], config: BacktestConfig) -> Dict[str, float]:
+    if not len(equity):
+        return {}
+    returns = np.diff(equity, prepend=config.initial_cash) / \
+        np.concatenate(([config.initial_cash], equity[:-1]))
+    interval = get_interval(timestamps)
+    bars_per_year = NANOSECONDS_PER_YEAR / interval if interval else 0
+    volatility = returns.std()
+    drawdowns = 1 - equity / np.maximum.accumulate(np.maximum(equity, config.initial_cash))
+    pnls = np.array([trade['pnl'] for trade in trades])
+    wins = pnls[pnls > 0]
+    losses = pnls[pnls < 0]
+    return {
+        'initial_cash': config.initial_cash,
+        'final_equity': float(equity[-1]),
+        'total_return_pct': float(equity[-1] / config.initial_cash - 1) * 100,
+        'max_drawdown_pct': float(drawdowns.max()) * 100,
+        'sharpe': float(returns.mean() / volatility * np.sqrt(bars_per_year)) if volatility else 0.0,
+        'trades': len(trades),
+        'win_rate_pct': len(wins) / len(trades) * 100 if trades else 0.0,
+        'profit_factor': float(wins.sum() / -losses.sum()) if len(losses) else (np.inf if len(wins) else 0.0),
+        'fees': float(sum(trade['fees'] for trade in trades)),
+        'exposure_pct': float(np.mean(positions != 0)) * 100,
+    }
@@ -0,0 +1,176 @@
+from data_types import BAR_COLUMNS, Bars, BarSeries, TimeframeString
+from typing import List, Optional, Tuple
+import numpy as np
+import json
+import os
+
+STORE_VERSION = 1
+COLUMN_DTYPES = {column: np.dtype('<i8') if column == 'timestamp' else np.dtype('<f8')
+                 for column in BAR_COLUMNS}
+
+
+def get_series_name(ticker: str, timeframe: TimeframeString):
+    # 1m and 1M would collide on case-insensitive file systems
+    timeframe = timeframe if '1m' not in timeframe else '1min'
+    return f"{ticker}-{timeframe}"
+
+
+def parse_series_name(series_name: str) -> Tuple[str, TimeframeString]:
+    ticker, timeframe = series_name.rsplit('-', 1)
+    return ticker, timeframe if timeframe != '1min' else '1m'
+
+
+class BarStore:
+    """
+    Columnar bar storage. Every series is a directory holding one raw
+    little-endian file per column plus a small JSON header with the bar count.
+    Columns are memory mapped on read, so reading the last N bars costs O(N).
+    The header is written last and bytes past its length are ignored, so
+    appending only touches the tail of each column.
+    """
+
+    def __init__(self, dirname="AlpacaData"):
+        self.dirname = dirname
+
+    def get_path(self, ticker: str, timeframe: TimeframeString):
+        return os.path.join(self.dirname, get_series_name(ticker, timeframe))
+
+    def exists(self, ticker: str, timeframe: TimeframeString):
+        return os.path.exists(self.__get_header_path(self.get_path(ticker, timeframe)))
+
+    def get_length(self, ticker: str, timeframe: TimeframeString) -> int:
+        if not self.exists(ticker, timeframe):
+            return 0
+        return self.__read_header(self.get_path(ticker, timeframe))['length']
+
+    def read(self, ticker: str, timeframe: TimeframeString, last: Optional[int] = None) -> BarSeries:
+        path = self.get_path(ticker, timeframe)
+        if not self.exists(ticker, timeframe):
+            raise FileNotFoundError(
+                f"No stored bars for {ticker} - {timeframe} in {path}")
+        length = self.__read_header(path)['length']
+        if not length:
+            return BarSeries.empty()
+        columns = [np.memmap(self.__get_column_path(path, column), dtype=COLUMN_DTYPES[column],
+                             mode='r', shape=(length,)) for column in BAR_COLUMNS]
+        bars = BarSeries(*columns)
+        return bars[-min(last, length):] if last else bars
+
+    def write(self, ticker: str, timeframe: TimeframeString, bars: Bars):
+        """Replace the stored series with bars."""
+        bars = BarSeries.coerce(bars)
+        path = self.get_path(ticker, timeframe)
+        os.makedirs(path, exist_ok=True)
+        for column in BAR_COLUMNS:
+            with open(self.__get_column_path(path, column), "wb") as file:
+                file.write(self.__to_bytes(bars, column))
+        self.__write_header(path, len(bars))
+
+    def append(self, ticker: str, timeframe: TimeframeString, bars: Bars) -> int:
+        """
+        Append bars to the stored series. Stored bars at or after the first new
+        timestamp are replaced, so a refetched (possibly unfinished) last bar is
+        not duplicated. Returns the number of bars added to the series.
+        """
+        bars = BarSeries.coerce(bars)
+        if not self.exists(ticker, timeframe):
+            self.write(ticker, timeframe, bars)
+            return len(bars)
+        if not len(bars):
+            return 0
+        path = self.get_path(ticker, timeframe)
+        length = self.get_length(ticker, timeframe)
+        seam = int(np.searchsorted(self.read(ticker, timeframe).timestamp, bars.timestamp[0]))
+        # Shrink first so an interrupted append never exposes half-written bars
+        if seam < length:
+            self.__write_header(path, seam)
+        for column in BAR_COLUMNS:
+            with open(self.__get_column_path(path, column), "r+b") as file:
+                offset = seam * COLUMN_DTYPES[column].itemsize
+                file.truncate(offset)
+                file.seek(offset)
+                file.write(self.__to_bytes(bars, column))
+        self.__write_header(path, seam + len(bars))
+        return seam + len(bars) - length
+
+    def get_last_timestamp(self, ticker: str, timeframe: TimeframeString) -> Optional[int]:
+        """Epoch-ns timestamp of the last stored bar, None when nothing is stored."""
+        if not self.get_length(ticker, timeframe):
+            return None
+        return int(self.read(ticker, timeframe, last=1).timestamp[-1])
+
+    def read_checkpoint(self, ticker: str, timeframe: TimeframeString) -> Optional[dict]:
+        """Progress saved by an unfinished download of the series, None if there is none."""
+        path = self.__get_checkpoint_path(self.get_path(ticker, timeframe))
+        if not os.path.exists(path):
+            return None
+        with open(path, "r") as file:
+            return json.load(file)
+
+    def write_checkpoint(self, ticker: str, timeframe: TimeframeString, checkpoint: dict):
+        path = self.get_path(ticker, timeframe)
+        os.makedirs(path, exist_ok=True)
+        temp_path = self.__get_checkpoint_path(path) + '.tmp'
+        with open(temp_path, "w") as file:
+            json.dump(checkpoint, file)
+        os.replace(temp_path, self.__get_checkpoint_path(path))
+
+    def remove_checkpoint(self, ticker: str, timeframe: TimeframeString):
+        path = self.__get_checkpoint_path(self.get_path(ticker, timeframe))
+        if os.path.exists(path):
+            os.remove(path)
+
+    def __to_bytes(self, bars: BarSeries, column: str):
+        return np.ascontiguousarray(getattr(bars, column), dtype=COLUMN_DTYPES[column]).tobytes()
+
+    def __read_header(self, path):
+        with open(self.__get_header_path(path), "r") as file:
+            return json.load(file)
+
+    def __write_header(self, path, length: int):
+        header = {
+            'version': STORE_VERSION,
+            'length': length,
+            'columns': {column: COLUMN_DTYPES[column].str for column in BAR_COLUMNS}
+        }
+        temp_path = self.__get_header_path(path) + '.tmp'
+        with open(temp_path, "w") as file:
+            json.dump(header, file)
+        os.replace(temp_path, self.__get_header_path(path))
+
+    def __get_header_path(self, path):
+        return os.path.join(path, "header.json")
+
+    def __get_checkpoint_path(self, path):
+        return os.path.join(path, "checkpoint.json")
+
+    def __get_column_path(self, path, column):
+        return os.path.join(path, f"{column}.bin")
+
+    def find_tickers(self, timeframe: TimeframeString) -> List[str]:
+        """Every ticker with a stored series for timeframe, sorted."""
+        if not os.path.isdir(self.dirname):
+            return []
+        series_names = [parse_series_name(name) for name in sorted(os.listdir(self.dirname))
+                        if '-' in name and os.path.exists(self.__get_header_path(os.path.join(self.dirname, name)))]
+        return [ticker for ticker, series_timeframe in series_names if series_timeframe == timeframe]
+
+    def get_json_path(self, ticker: str, timeframe: TimeframeString):
+        return os.path.join(self.dirname, f"{get_series_name(ticker, timeframe)}.json")
+
+    def find_json_series(self) -> List[Tuple[str, TimeframeString]]:
+        """(ticker, timeframe) of every legacy JSON file in the store directory."""
+        if not os.path.isdir(self.dirname):
+            return []
+        return [parse_series_name(file_name[:-len('.json')]) for file_name in sorted(os.listdir(self.dirname))
+                if file_name.endswith('.json')]
+
+    def migrate_json(self, ticker: str, timeframe: TimeframeString, remove=False) -> int:
+        """Convert a legacy JSON file into the store. Returns the number of bars."""
+        json_path = self.get_json_path(ticker, timeframe)
+        with open(json_path, "r") as file:
+            bars = BarSeries.from_bar_dicts(json.load(file))
+        self.write(ticker, timeframe, bars)
+        if remove:
+            os.remove(json_path)
+        return len(bars)
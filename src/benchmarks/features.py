@@ -0,0 +1,45 @@
+"""
+Compares computing every tool in TOOL_NAMES on its own against computing
+them together over one shared FeatureSet, next to the slowest single tool.
+Run from src with `python -m benchmarks.features`.
+"""
+from synthetic_bars import generate_bars
+from config import TOOL_NAMES
+from toolbox import create_tool
+from toolbox.features import share_features
+import click
+import time
+
+TOOLS = list(dict.fromkeys(TOOL_NAMES))
+
+
+def time_tools(bars, is_shared: bool):
+    """Seconds per tool, computed in TOOL_NAMES order, and the FeatureSet if shared."""
+    tools = [create_tool(tool_name) for tool_name in TOOLS]
+    features = share_features(tools, bars) if is_shared else None
+    seconds = {}
+    for tool_name, tool in zip(TOOLS, tools):
+        started = time.perf_counter()
+        tool.calculate_historical_data(bars)
+        seconds[tool_name] = time.perf_counter() - started
+    return seconds, features
+
+
+@click.command()
+@click.option('--size', 'sizes', multiple=True, type=int, default=(100000, 1000000), show_default=True)
+@click.option('--seed', default=0, show_default=True)
+def main(sizes, seed):
+    print(f"{'Bars':>9}{'Slowest tool':>22}{'Seconds':>9}{'Separate':>10}{'Shared':>9}  Features")
+    for size in sorted(sizes):
+        bars = generate_bars(size, seed=seed)
+        separate, _ = time_tools(bars, is_shared=False)
+        shared, features = time_tools(bars, is_shared=True)
+        slowest = max(separate, key=separate.get)
+        declared = sum(len(create_tool(tool_name).get_features()) for tool_name in TOOLS)
+        stats = features.get_stats()
+        print(f"{size:>9}{slowest:>22}{separate[slowest]:>9.4f}{sum(separate.values()):>10.4f}"
+              f"{sum(shared.values()):>9.4f}  {declared} declared, {stats['features']} computed")
+
+
+if __name__ == '__main__':
+    main()
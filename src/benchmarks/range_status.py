@@ -0,0 +1,58 @@
+"""
+Times the PotentialRange bar status lookup through IntervalIndex against the
+linear scan over every validated range it replaced, timing the whole
+calculate_historical_data call. tests/test_range.py checks both agree.
+Run from src with `python -m benchmarks.range_status`.
+"""
+from typing import List
+from synthetic_bars import generate_bars
+from toolbox import range as range_module
+from toolbox.range import PotentialRange, RangeConfig
+import bisect
+import time
+
+
+class LinearScanIndex:
+    """Same interface as IntervalIndex, scanning every interval on each lookup."""
+
+    def __init__(self, coordinates=()):
+        self.intervals: List[tuple] = []
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def add(self, low, high, priority, item):
+        bisect.insort(self.intervals, (priority, low, high, item),
+                      key=lambda interval: interval[0])
+
+    def find(self, price):
+        for _, low, high, item in self.intervals:
+            if price > low and price < high:
+                return item
+        return None
+
+
+def time_status(bars, config: RangeConfig, index_class):
+    original_index_class = range_module.IntervalIndex
+    range_module.IntervalIndex = index_class
+    try:
+        tool = PotentialRange(config)
+        started = time.perf_counter()
+        data = tool.calculate_historical_data(bars)
+        return time.perf_counter() - started, data, len(tool.ranges)
+    finally:
+        range_module.IntervalIndex = original_index_class
+
+
+if __name__ == '__main__':
+    print(f"{'Bars':>8}{'Lookback':>10}{'Ranges':>8}{'Scan s':>10}{'Index s':>10}")
+    for bar_count in (10000, 100000):
+        bars = generate_bars(bar_count)
+        for lookback_period in (5, 20):
+            config = RangeConfig(lookback_period=lookback_period, min_points_distance=lookback_period,
+                                 max_points_distance=lookback_period * 8, min_zone_size=0.5)
+            scan_seconds, _, range_count = time_status(
+                bars, config, LinearScanIndex)
+            index_seconds, _, _ = time_status(
+                bars, config, range_module.IntervalIndex)
+            print(f"{bar_count:>8}{lookback_period:>10}{range_count:>8}{scan_seconds:>10.2f}{index_seconds:>10.2f}")
@@ -0,0 +1,34 @@
+"""
+Compares the figure look_at_this_graph builds in SVG and WebGL render modes:
+the time to build it, the time to serialize it and the size of the JSON the
+browser has to load. Indicators are computed once up front through an
+IndicatorCache, so only rendering is timed.
+Run from src with `python -m benchmarks.render`.
+"""
+from synthetic_bars import generate_bars
+from indicator_cache import IndicatorCache
+from config import TOOL_NAMES
+from viz import build_figure
+import time
+
+TOOLS = list(dict.fromkeys(TOOL_NAMES))
+
+
+def time_render(bars, render_mode, cache: IndicatorCache):
+    started = time.perf_counter()
+    fig = build_figure(bars, 'BTC/USD', '1m', TOOLS, cache, render_mode)
+    built = time.perf_counter()
+    figure_json = fig.to_json()
+    return built - started, time.perf_counter() - built, len(figure_json)
+
+
+if __name__ == '__main__':
+    print(f"{'Bars':>8}{'Mode':>7}{'Build s':>9}{'JSON s':>8}{'JSON MB':>9}")
+    for bar_count in (5000, 20000, 100000):
+        bars = generate_bars(bar_count)
+        cache = IndicatorCache()
+        build_figure(bars, 'BTC/USD', '1m', TOOLS, cache)
+        for render_mode in ("SVG", "WebGL"):
+            build_seconds, json_seconds, size = time_render(
+                bars, render_mode, cache)
+            print(f"{bar_count:>8}{render_mode:>7}{build_seconds:>9.3f}{json_seconds:>8.3f}{size / 1e6:>9.2f}")
@@ -0,0 +1,65 @@
+"""
+Times how long `python cli.py <command> --help` takes for every CLI command,
+which is the import cost every run of the command pays before doing any
+work, and how much of it the heavy packages account for.
+Run from src with `python -m benchmarks.startup`.
+"""
+from typing import Dict, List
+import subprocess
+import click
+import sys
+import time
+
+# Packages worth keeping out of commands that don't need them
+HEAVY_PACKAGES = ('plotly', 'alpaca', 'pydantic', 'pandas')
+
+
+def time_startup(arguments: List[str], repeat=5) -> float:
+    """Best of repeat runs of the CLI with arguments, in a fresh interpreter each."""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, 'cli.py', *arguments], capture_output=True, check=True)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def get_heavy_imports(arguments: List[str]) -> Dict[str, float]:
+    """Import seconds spent in the modules of every heavy package the CLI imported, from -X importtime."""
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', 'cli.py', *arguments],
+                            capture_output=True, text=True, check=True).stderr
+    heavy_imports = {}
+    for line in stderr.splitlines():
+        # "import time: self [us] | cumulative | module", summing self times counts every module once
+        fields = line.split('|')
+        package = fields[-1].strip().split('.')[0]
+        if len(fields) != 3 or package not in HEAVY_PACKAGES:
+            continue
+        self_seconds = int(fields[0].rsplit(':', 1)[1]) / 1e6
+        heavy_imports[package] = heavy_imports.get(package, 0.0) + self_seconds
+    return heavy_imports
+
+
+@click.command()
+@click.option('--repeat', default=5, show_default=True, help='Runs per command, the fastest is kept')
+def main(repeat):
+    from cli import cli
+    print(f"{'Command':<12}{'Seconds':>9}  Heavy imports")
+    interpreter = min(_time_interpreter() for _ in range(repeat))
+    print(f"{'(python)':<12}{interpreter:>9.3f}")
+    for command in [None, *cli.commands]:
+        arguments = [command, '--help'] if command else ['--help']
+        seconds = time_startup(arguments, repeat)
+        heavy_imports = ', '.join(f"{package} {seconds:.3f}s"
+                                  for package, seconds in get_heavy_imports(arguments).items())
+        print(f"{command or '(group)':<12}{seconds:>9.3f}  {heavy_imports or '-'}")
+
+
+def _time_interpreter() -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, '-c', 'pass'], check=True)
+    return time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""
+Times PotentialRange finding potential ranges through find_swing_points
+against the SwingTracker state machine finding them close by close.
+tests/test_range.py checks both find the same ones.
+Run from src with `python -m benchmarks.swings`.
+"""
+from synthetic_bars import generate_bars
+from toolbox.range import PotentialRange, RangeConfig, SwingTracker
+import time
+
+
+def track_swings(tool: PotentialRange, bars):
+    """Potential ranges of both level types from SwingTracker, the way PotentialRange used to find them."""
+    closes = bars.close.tolist()
+    potential_ranges = {}
+    for level_type in ('Resistance', 'Support'):
+        swing_tracker = SwingTracker(level_type, tool.lookback_period,
+                                     tool._PotentialRange__is__potential_range)
+        potential_ranges[level_type] = [potential_range
+                                        for i in range(tool.lookback_period, len(closes))
+                                        if (potential_range := swing_tracker.update(i, closes[i]))]
+    return potential_ranges
+
+
+def time_swings(find, tool: PotentialRange, bars):
+    started = time.perf_counter()
+    potential_ranges = find(tool, bars)
+    return time.perf_counter() - started, potential_ranges
+
+
+if __name__ == '__main__':
+    print(f"{'Bars':>8}{'Lookback':>10}{'Ranges':>8}{'Tracker s':>11}{'Array s':>10}")
+    for bar_count in (10000, 1000000):
+        bars = generate_bars(bar_count)
+        for lookback_period in (1, 5, 20, 50):
+            config = RangeConfig(lookback_period=lookback_period, min_points_distance=lookback_period,
+                                 max_points_distance=lookback_period * 8, min_zone_size=0.5)
+            tool = PotentialRange(config)
+            tracker_seconds, _ = time_swings(track_swings, tool, bars)
+            array_seconds, array_ranges = time_swings(
+                lambda tool, bars: tool._PotentialRange__find_potential_ranges(bars), tool, bars)
+            range_count = sum(len(potential_ranges) for potential_ranges in array_ranges.values())
+            print(f"{bar_count:>8}{lookback_period:>10}{range_count:>8}{tracker_seconds:>11.2f}{array_seconds:>10.2f}")
@@ -0,0 +1,112 @@
+"""
+Times calculate_historical_data of every toolbox indicator on seeded
+synthetic bars and records its peak memory, so runs can be compared across
+commits. Run from src with `python -m benchmarks.tools --output results.json`,
+then `python -m benchmarks.tools --compare results.json` on another commit.
+"""
+from typing import Callable, Dict, List, Optional
+from synthetic_bars import generate_bars
+from toolbox import FibonacciRetracement, MARibbon, PotentialRange, Ichimoku, VolumeProfile
+from toolbox.tool_base import ToolBase
+from toolbox.ma_ribbon import MARibbonConfig
+from toolbox.fib_retrace import FibonacciRetracementConfig
+from toolbox.vol_profile import VolumeProfileConfig
+import subprocess
+import tracemalloc
+import platform
+import click
+import json
+import time
+import numpy as np
+
+TOOLS: Dict[str, Callable[[], ToolBase]] = {
+    'Range': PotentialRange,
+    'Ichimoku': Ichimoku,
+    'FibonacciRetracement': FibonacciRetracement,
+    'FibonacciRetracement Rolling': lambda: FibonacciRetracement(FibonacciRetracementConfig(lookback=500)),
+    'MARibbon SMA': MARibbon,
+    'MARibbon EMA': lambda: MARibbon(MARibbonConfig(ma_type='EMA')),
+    'MARibbon WMA': lambda: MARibbon(MARibbonConfig(ma_type='WMA')),
+    'VolumeProfile': VolumeProfile,
+    'VolumeProfile Rolling': lambda: VolumeProfile(VolumeProfileConfig(mode='Rolling')),
+}
+SIZES = (1000, 10000, 100000, 1000000)
+
+
+def time_tool(make_tool: Callable[[], ToolBase], bars, repeat=1) -> float:
+    """Best of repeat runs, each on a fresh tool."""
+    best = float('inf')
+    for _ in range(repeat):
+        tool = make_tool()
+        started = time.perf_counter()
+        tool.calculate_historical_data(bars)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def measure_peak_memory(make_tool: Callable[[], ToolBase], bars) -> int:
+    """Peak bytes allocated during one run, NumPy buffers included. Traced separately since tracing slows the run."""
+    tool = make_tool()
+    tracemalloc.start()
+    try:
+        tool.calculate_historical_data(bars)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def get_commit() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(tool_names: List[str], sizes: List[int], repeat=1, seed=0):
+    """Yields a result per tool and size as soon as it is measured."""
+    for size in sizes:
+        bars = generate_bars(size, seed=seed)
+        for tool_name in tool_names:
+            seconds = time_tool(TOOLS[tool_name], bars, repeat)
+            peak_bytes = measure_peak_memory(TOOLS[tool_name], bars)
+            yield {'tool': tool_name, 'bars': size, 'seconds': seconds, 'peak_bytes': peak_bytes}
+
+
+@click.command()
+@click.option('--tool', 'tool_names', multiple=True, type=click.Choice(list(TOOLS)), help='Defaults to every tool')
+@click.option('--size', 'sizes', multiple=True, type=int, default=SIZES, show_default=True)
+@click.option('--repeat', default=1, show_default=True, help='Runs per measurement, the fastest is kept')
+@click.option('--seed', default=0, show_default=True)
+@click.option('--output', type=click.Path(dir_okay=False), help='Write the results as JSON')
+@click.option('--compare', type=click.Path(exists=True, dir_okay=False), help='JSON results of an earlier run to compare against')
+def main(tool_names, sizes, repeat, seed, output, compare):
+    baseline = {}
+    if compare:
+        with open(compare, "r") as file:
+            baseline = {(result['tool'], result['bars']): result
+                        for result in json.load(file)['results']}
+    print(f"{'Tool':<30}{'Bars':>9}{'Seconds':>10}{'Peak MB':>9}{'Speedup':>9}")
+    results = []
+    for result in run_benchmarks(list(tool_names or TOOLS), sorted(sizes), repeat, seed):
+        results.append(result)
+        previous = baseline.get((result['tool'], result['bars']))
+        speedup = f"{previous['seconds'] / result['seconds']:.2f}x" if previous else ''
+        print(f"{result['tool']:<30}{result['bars']:>9}{result['seconds']:>10.4f}"
+              f"{result['peak_bytes'] / 1e6:>9.1f}{speedup:>9}")
+    if output:
+        meta = {
+            'commit': get_commit(),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'machine': platform.machine(),
+            'seed': seed,
+            'repeat': repeat,
+        }
+        with open(output, "w") as file:
+            json.dump({'meta': meta, 'results': results}, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Times a walk-forward run on one worker and on every core against a single
+full history run. tests/test_walk_forward.py checks the stitched test
+segments are the full history run's. Runs on synthetic 15m bars, resampled
+to 1H, in a temporary store.
+Run from src with `python -m benchmarks.walk_forward`.
+"""
+from synthetic_bars import generate_bars
+from bar_store import BarStore
+from resampler import resample_into_store
+from backtest import BacktestConfig, run_backtest
+from strategies import Strategy1
+from walk_forward import WalkForwardJob, get_windows, run_walk_forward, stitch
+import click
+import os
+import tempfile
+import time
+
+
+def time_walk_forward(job: WalkForwardJob, windows, bars, workers):
+    started = time.perf_counter()
+    results = list(run_walk_forward(job, windows, workers))
+    return time.perf_counter() - started, stitch(results, bars, job.backtest_config)
+
+
+@click.command()
+@click.option('--size', 'sizes', multiple=True, type=int, default=(50000, 200000), show_default=True)
+@click.option('--train-size', default=96 * 90, show_default=True)
+@click.option('--test-size', default=96 * 30, show_default=True)
+@click.option('--seed', default=0, show_default=True)
+def main(sizes, train_size, test_size, seed):
+    config = BacktestConfig()
+    print(f"{'Bars':>8}{'Windows':>9}{'Full s':>9}{'1 worker s':>12}{f'{os.cpu_count()} workers s':>14}")
+    for size in sorted(sizes):
+        with tempfile.TemporaryDirectory() as dirname:
+            store = BarStore(dirname)
+            store.write('BTC', '15m', generate_bars(size, seed=seed, interval_seconds=15 * 60))
+            resample_into_store(store, 'BTC', '1H', '15m', full=True)
+            bars = (store.read('BTC', '15m'), store.read('BTC', '1H'))
+            started = time.perf_counter()
+            signals = Strategy1(config=config).get_signals(*bars)
+            run_backtest(bars[0], signals, config)
+            full_seconds = time.perf_counter() - started
+            windows = get_windows(size, train_size, test_size)
+            job = WalkForwardJob('BTC', '15m', '1H', dirname, config)
+            serial_seconds, _ = time_walk_forward(job, windows, bars[0], 1)
+            parallel_seconds, _ = time_walk_forward(job, windows, bars[0], None)
+            print(f"{size:>8}{len(windows):>9}{full_seconds:>9.2f}{serial_seconds:>12.2f}{parallel_seconds:>14.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,76 +1,315 @@
 import click
-from alpaca_interface import AlpacaInterface
-from viz import look_at_this_graph
-import json
-from data_types import BarData, TimeframeString
-from typing import List
-from config import LOOKBACK_PERIOD, TICKERS, TIMEFRAMES, TOOL_NAMES
+from decimation import RenderMode
+from data_types import BarSeries, TimeframeString
+from bar_store import BarStore
+from profiler import profiler
+from resampler import resample_into_store
+from config import LOOKBACK_PERIOD, TICKERS, TIMEFRAMES, TOOL_NAMES, FETCH_CONCURRENCY, FETCH_REQUESTS_PER_MINUTE, INDICATOR_CACHE_MAX_MB, INDICATOR_CACHE_DIR, BACKTEST_DIR, BACKTEST_FEE_RATE, BACKTEST_SLIPPAGE, BASE_TIMEFRAME
+from indicator_cache import IndicatorCache
+from fetch_scheduler import FetchJob, FetchScheduler, ThrottledClient, TokenBucket, format_summary
 from strategies import Strategy1
+from backtest import STAT_NAMES, BacktestConfig
+from toolbox import create_tool
+from toolbox.vol_profile import VolumeProfileConfig, VolumeProfileMode
+from live import AlpacaStreamSource, LiveRunner, LiveSignal, ReplaySource
+from scan import ScanJob, run_scan, format_table as format_scan_table, format_summary as format_scan_summary
+from sweep import SweepJob, format_result, format_table, get_combinations, parse_param, run_sweep
+from walk_forward import WalkForwardJob, get_windows, run_walk_forward, stitch, format_result as format_window_result, \
+    format_table as format_window_table, format_summary as format_walk_forward_summary
+from typing import TYPE_CHECKING, get_args
+import datetime
 import os
+import time
+
+if TYPE_CHECKING:
+    from alpaca_interface import AlpacaInterface
 
 TOOL_NAMES = list(dict.fromkeys(TOOL_NAMES))
+store = BarStore()
+# Shared by every command computing indicators
+cache = IndicatorCache(INDICATOR_CACHE_MAX_MB * 1024 * 1024, INDICATOR_CACHE_DIR)
 
 
 @click.group()
-def cli():
+@click.option('--profile', 'profile_path', type=click.Path(dir_okay=False),
+              help='Write a per-stage timing and allocation report as JSON')
+@click.option('--cprofile', 'cprofile_path', type=click.Path(dir_okay=False),
+              help='With --profile, also dump cProfile stats of the slowest stage')
+@click.pass_context
+def cli(ctx, profile_path, cprofile_path):
     """Wusup"""
-    pass
+    if profile_path:
+        profiler.enable(use_cprofile=bool(cprofile_path))
+
+        def write_profile():
+            profiler.write_report(profile_path, cprofile_path)
+            profiler.disable()
+        ctx.call_on_close(write_profile)
 
 
 @cli.command()
-def fetchall():
-    for ticker in TICKERS:
-        symbol = get_symbol(ticker)
+@click.option('--full', is_flag=True, help='Rebuild from scratch instead of appending new bars')
+@click.option('--concurrency', default=FETCH_CONCURRENCY, show_default=True, help='Number of parallel downloads')
+def fetchall(full, concurrency):
+    # The Alpaca SDK takes most of the startup time, only the commands downloading bars import it
+    from alpaca_interface import AlpacaInterface, get_client, set_connection_pool_size
+    set_connection_pool_size(concurrency)
+    data_client = ThrottledClient(get_client(), TokenBucket(
+        FETCH_REQUESTS_PER_MINUTE / 60, capacity=concurrency))
+
+    def fetch(job: FetchJob):
+        print(f'Fetching for {get_symbol(job.ticker)} - {job.timeframe}...')
+        client = AlpacaInterface(get_symbol(job.ticker),
+                                 job.timeframe, data_client=data_client)
+        bar_count = fetch_into_store(store, client, job.ticker, job.timeframe, full)
+        # Every other timeframe is built from the base one, so their bars line up exactly
         for timeframe in TIMEFRAMES:
-            print(f'Fetching for {symbol} - {timeframe}...')
-            client = AlpacaInterface(symbol, timeframe)
-            bars = client.fetch()
-            file_name = get_file_name(ticker, timeframe)
-            with open(file_name, "w") as file:
-                json.dump([bar for bar in bars], file, indent=4)
-            print('Done!')
+            if timeframe != BASE_TIMEFRAME:
+                resample_into_store(store, job.ticker, timeframe, BASE_TIMEFRAME, full)
+        return bar_count
+
+    jobs = [FetchJob(ticker, BASE_TIMEFRAME) for ticker in TICKERS]
+    started = time.perf_counter()
+    results = FetchScheduler(fetch, concurrency).run(jobs)
+    print(format_summary(results, time.perf_counter() - started))
 
 
 @cli.command()
-def plot():
+@click.option('--full', is_flag=True, help='Rebuild from scratch instead of updating the last bars')
+@click.option('--timeframe', 'timeframes', multiple=True, default=TIMEFRAMES, show_default=True,
+              type=click.Choice(list(get_args(TimeframeString))), help='Timeframes to build')
+def resample(full, timeframes):
+    """Build higher timeframes from the stored base timeframe bars"""
+    for ticker in TICKERS:
+        for timeframe in timeframes:
+            if timeframe == BASE_TIMEFRAME:
+                continue
+            print(f'Resampling {get_symbol(ticker)} - {BASE_TIMEFRAME} into {timeframe}...')
+            bar_count = resample_into_store(store, ticker, timeframe, BASE_TIMEFRAME, full)
+            print(f'Done! {bar_count} new bars')
+
+
+@profiler.timed()
+def fetch_into_store(store: BarStore, client: "AlpacaInterface", ticker: str, timeframe: TimeframeString, full=False):
+    """
+    Downloads page by page, appending each page to the store and saving a
+    checkpoint after it, so memory stays flat and an interrupted download,
+    full or not, resumes after the last stored page. A checkpoint left by a
+    download of the other kind is ignored, so --full always rebuilds.
+    Returns the number of bars added.
+    """
+    checkpoint = store.read_checkpoint(ticker, timeframe)
+    last_timestamp = store.get_last_timestamp(ticker, timeframe)
+    if checkpoint is not None and checkpoint.get('full') == full:
+        start = datetime.datetime.fromisoformat(checkpoint['fetched_until'])
+    elif full or last_timestamp is None:
+        store.write(ticker, timeframe, BarSeries.empty())
+        start = None
+    else:
+        # Refetch the last stored bar too, it may not have been closed yet
+        start = datetime.datetime.fromtimestamp(
+            last_timestamp / 1e9, datetime.timezone.utc)
+    bar_count = 0
+    for page_end, bars in client.fetch_pages(start):
+        bar_count += store.append(ticker, timeframe, bars)
+        store.write_checkpoint(ticker, timeframe, {'fetched_until': page_end.isoformat(), 'full': full})
+    store.remove_checkpoint(ticker, timeframe)
+    return bar_count
+
+
+@cli.command()
+@click.option('--render-mode', default="WebGL", show_default=True, type=click.Choice(list(get_args(RenderMode))),
+              help='SVG draws every point, WebGL decimates to --max-points first')
+@click.option('--max-points', default=2000, show_default=True, help='Points per line and candles kept in WebGL mode')
+def plot(render_mode, max_points):
+    from viz import look_at_this_graph
     for ticker in TICKERS:
         symbol = get_symbol(ticker)
         for timeframe in TIMEFRAMES:
             print(f"Parsing data for {symbol} - {timeframe}...")
-            file_name = get_file_name(ticker, timeframe)
-            with open(file_name, "r") as file:
-                bars: List[BarData] = json.load(file)
-                bars = bars[-min(LOOKBACK_PERIOD, len(bars)):]
-                look_at_this_graph(bars, symbol, timeframe, TOOL_NAMES)
-                print('Done!')
+            # Memory mapped, pages are only loaded once the tools touch them
+            with profiler.stage("read bars"):
+                bars = store.read(ticker, timeframe, last=LOOKBACK_PERIOD)
+            look_at_this_graph(bars, symbol, timeframe, TOOL_NAMES, cache,
+                               render_mode, max_points)
+            print('Done!')
+    print(f'Indicator cache: {cache.get_stats()}')
 
 
 @cli.command()
 def backtest():
+    config = BacktestConfig(BACKTEST_FEE_RATE, BACKTEST_SLIPPAGE)
     for ticker in TICKERS:
         symbol = get_symbol(ticker)
         low_timeframe: TimeframeString = '15m'
         high_timeframe: TimeframeString = '1H'
-        bars_low_timeframe: List[BarData] = []
-        bars_high_timeframe: List[BarData] = []
-        file_name = get_file_name(ticker, low_timeframe)
-        with open(file_name, "r") as file:
-            bars_low_timeframe = json.load(file)
-        file_name = get_file_name(ticker, high_timeframe)
-        with open(file_name, "r") as file:
-            bars_high_timeframe = json.load(file)
-        strategy = Strategy1()
-        strategy.backtest(bars_low_timeframe, bars_high_timeframe)
+        print(f"Backtesting {symbol} - {low_timeframe}/{high_timeframe}...")
+        with profiler.stage("read bars"):
+            bars_low_timeframe = store.read(ticker, low_timeframe)
+            bars_high_timeframe = store.read(ticker, high_timeframe)
+        strategy = Strategy1(cache, config)
+        with profiler.stage("backtest"):
+            result = strategy.backtest(bars_low_timeframe, bars_high_timeframe)
+        path = os.path.join(
+            BACKTEST_DIR, f"{ticker}-{low_timeframe}-{high_timeframe}.json")
+        with profiler.stage("write results"):
+            result.write(path)
+        stats = result.stats
+        print(f"Done! {stats['trades']} trades, {stats['total_return_pct']:.2f}% return, "
+              f"{stats['max_drawdown_pct']:.2f}% max drawdown, results in {path}")
+    print(f'Indicator cache: {cache.get_stats()}')
 
-def get_symbol(ticker):
-    return f"{ticker}/USD"
 
+@cli.command()
+@click.option('--param', 'params', multiple=True, required=True,
+              help='Tool.field=values to sweep, e.g. Range.lookback_period=20,50,100 or MARibbon.periods=[[5,20],[10,50]]')
+@click.option('--ticker', default=TICKERS[0], show_default=True)
+@click.option('--metric', default='sharpe', show_default=True, type=click.Choice(STAT_NAMES), help='Backtest stat to rank by')
+@click.option('--workers', default=None, type=int, help='Worker processes, defaults to the number of cores')
+def sweep(params, ticker, metric, workers):
+    """Backtest every combination of a parameter grid and rank the results"""
+    try:
+        grid = dict(parse_param(param) for param in params)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint='--param')
+    combinations = get_combinations(grid)
+    job = SweepJob(ticker, '15m', '1H', store.dirname,
+                   BacktestConfig(BACKTEST_FEE_RATE, BACKTEST_SLIPPAGE))
+    print(f"Sweeping {len(combinations)} combinations for {get_symbol(ticker)}...")
+    started = time.perf_counter()
+    results = []
+    for result in run_sweep(job, combinations, workers):
+        results.append(result)
+        print(f"[{len(results)}/{len(combinations)}] {format_result(result, metric)}")
+    print(format_table(results, metric))
+    print(f"Done! {len(results)} combinations in {time.perf_counter() - started:.2f}s")
 
-def get_file_name(ticker: str, timeframe: TimeframeString):
-    dirname = "AlpacaData"
-    os.makedirs(dirname, exist_ok=True)
-    timeframe = timeframe if '1m' not in timeframe else '1min'
-    return f"{dirname}/{ticker}-{timeframe}.json"
+
+@cli.command()
+@click.option('--ticker', default=TICKERS[0], show_default=True)
+@click.option('--train-size', default=96 * 90, show_default=True, help='15m bars per train segment')
+@click.option('--test-size', default=96 * 30, show_default=True, help='15m bars per test segment')
+@click.option('--step', type=int, help='15m bars between window starts, defaults to --test-size')
+@click.option('--param', 'params', multiple=True,
+              help='Tool.field=values to pick from on every train segment, same format as sweep. Defaults to the default configs')
+@click.option('--metric', default='sharpe', show_default=True, type=click.Choice(STAT_NAMES),
+              help='Backtest stat the train segments are ranked by')
+@click.option('--workers', default=None, type=int, help='Worker processes, defaults to the number of cores')
+def walkforward(ticker, train_size, test_size, step, params, metric, workers):
+    """Backtest rolling train/test windows and report the test segments out of sample"""
+    try:
+        grid = dict(parse_param(param) for param in params)
+    except ValueError as error:
+        raise click.BadParameter(str(error), param_hint='--param')
+    low_timeframe: TimeframeString = '15m'
+    high_timeframe: TimeframeString = '1H'
+    config = BacktestConfig(BACKTEST_FEE_RATE, BACKTEST_SLIPPAGE)
+    bars_low_timeframe = store.read(ticker, low_timeframe)
+    try:
+        windows = get_windows(len(bars_low_timeframe), train_size, test_size, step)
+    except ValueError as error:
+        raise click.UsageError(str(error))
+    if not windows:
+        raise click.UsageError(f'Not enough {low_timeframe} bars for a {train_size} + {test_size} bar window')
+    job = WalkForwardJob(ticker, low_timeframe, high_timeframe, store.dirname, config,
+                         get_combinations(grid), metric)
+    print(f"Walking forward over {len(windows)} windows for {get_symbol(ticker)} - {low_timeframe}/{high_timeframe}...")
+    started = time.perf_counter()
+    results = []
+    for result in run_walk_forward(job, windows, workers):
+        results.append(result)
+        print(f"[{len(results)}/{len(windows)}] {format_window_result(result, metric)}")
+    stitched = stitch(results, bars_low_timeframe, config)
+    print(format_window_table(results, metric))
+    print(format_walk_forward_summary(results, stitched, time.perf_counter() - started))
+    if stitched is not None:
+        path = os.path.join(
+            BACKTEST_DIR, f"{ticker}-{low_timeframe}-{high_timeframe}-walkforward.json")
+        stitched.write(path)
+        print(f"Out of sample results in {path}")
+
+
+@cli.command()
+@click.option('--ticker', 'tickers', multiple=True, help='Defaults to every ticker stored for the timeframe')
+@click.option('--timeframe', default=TIMEFRAMES[0], show_default=True, type=click.Choice(list(get_args(TimeframeString))))
+@click.option('--lookback', default=LOOKBACK_PERIOD, show_default=True, help='Latest bars per ticker the tools run over')
+@click.option('--workers', default=None, type=int, help='Worker processes, defaults to the number of cores')
+@click.option('--batch-size', default=16, show_default=True, help='Tickers loaded and scanned per worker task')
+@click.option('--all', 'show_all', is_flag=True, help='List tickers without a signal too')
+def scan(tickers, timeframe, lookback, workers, batch_size, show_all):
+    """Find tickers whose last close is inside a validated range and near a fib level"""
+    tickers = list(tickers) or store.find_tickers(timeframe)
+    if not tickers:
+        raise click.UsageError(f'No stored {timeframe} bars in {store.dirname}, run fetchall first')
+    print(f"Scanning {len(tickers)} tickers - {timeframe}...")
+    started = time.perf_counter()
+    results = list(run_scan(ScanJob(timeframe, store.dirname, lookback, INDICATOR_CACHE_DIR), tickers, workers, batch_size))
+    print(format_scan_table(results, show_all))
+    print(format_scan_summary(results, time.perf_counter() - started))
+
+
+@cli.command()
+@click.option('--source', default='replay', show_default=True, type=click.Choice(['replay', 'alpaca']),
+              help='replay streams the stored series, alpaca the live websocket')
+@click.option('--ticker', default=TICKERS[0], show_default=True)
+@click.option('--timeframe', default=BASE_TIMEFRAME, show_default=True, type=click.Choice(list(get_args(TimeframeString))),
+              help=f'Stored series to warm up on (and replay), alpaca only streams {BASE_TIMEFRAME} bars')
+@click.option('--warm-up', default=LOOKBACK_PERIOD, show_default=True, help='Stored bars fed through the tools first')
+@click.option('--interval', default=0.0, show_default=True, help='Seconds between replayed bars, 0 is as fast as possible')
+@click.option('--max-bars', type=int, help='Stop after this many live bars')
+@click.option('--profile-mode', default='Rolling', show_default=True, type=click.Choice(list(get_args(VolumeProfileMode))),
+              help="VolumeProfile mode, Fixed re-bins the whole history on every new high or low")
+@click.option('--api-key', envvar='ALPACA_API_KEY', help='Needed by the websocket [env: ALPACA_API_KEY]')
+@click.option('--secret-key', envvar='ALPACA_SECRET_KEY', help='[env: ALPACA_SECRET_KEY]')
+def live(source, ticker, timeframe, warm_up, interval, max_bars, profile_mode, api_key, secret_key):
+    """Update the tools bar by bar from a stream and print signals as they change"""
+    if source == 'alpaca':
+        if not api_key or not secret_key:
+            raise click.UsageError(
+                'The Alpaca websocket needs --api-key and --secret-key')
+        # The warm-up series has to be the streamed one
+        if timeframe != BASE_TIMEFRAME:
+            raise click.UsageError(
+                f'The Alpaca websocket streams {BASE_TIMEFRAME} bars, use --timeframe {BASE_TIMEFRAME}')
+    tools = {tool_name: create_tool(tool_name) for tool_name in TOOL_NAMES}
+    if 'VolumeProfile' in tools:
+        tools['VolumeProfile'] = create_tool('VolumeProfile', VolumeProfileConfig(mode=profile_mode))
+    runner = LiveRunner(tools)
+    bars = store.read(ticker, timeframe)
+    if source == 'replay':
+        runner.warm_up(bars[:warm_up])
+        bar_source = ReplaySource(bars[warm_up:], interval)
+    else:
+        # bars[-0:] would be every bar
+        runner.warm_up(bars[max(len(bars) - warm_up, 0):])
+        bar_source = AlpacaStreamSource(get_symbol(ticker), api_key, secret_key)
+    print(f"Streaming {get_symbol(ticker)} from {source} after {min(warm_up, len(bars))} warm-up bars...")
+
+    def on_signal(live_signal: LiveSignal):
+        print(f"{live_signal['timestamp']}  {live_signal['signal']:>2}  close {live_signal['close']:.2f}"
+              f"  latency {live_signal['latency_seconds'] * 1e6:.0f}us")
+    try:
+        runner.run(bar_source, on_signal, max_bars)
+    except KeyboardInterrupt:
+        pass
+    stats = runner.get_latency_stats()
+    if stats['bars']:
+        print(f"{stats['bars']} bars, latency mean {stats['mean_us']:.0f}us, p50 {stats['p50_us']:.0f}us, "
+              f"p99 {stats['p99_us']:.0f}us, max {stats['max_us']:.0f}us")
+
+
+@cli.command()
+@click.option('--remove-json', is_flag=True, help='Delete the JSON files once converted')
+def migrate(remove_json):
+    """Convert the legacy AlpacaData JSON files into the binary bar store"""
+    for ticker, timeframe in store.find_json_series():
+        print(f'Migrating {ticker} - {timeframe}...')
+        bar_count = store.migrate_json(ticker, timeframe, remove=remove_json)
+        print(f'Done! {bar_count} bars')
+
+
+def get_symbol(ticker):
+    return f"{ticker}/USD"
 
 
 if __name__ == '__main__':
@@ -6,7 +6,19 @@ TIMEFRAMES: List[TimeframeString] = [
     # "1M", "1W", "1D", "4H", "1H", "30m", "15m", "1m"
     "1D"
 ]
+# Fetched from Alpaca, every timeframe in TIMEFRAMES is resampled from it
+BASE_TIMEFRAME: TimeframeString = "1m"
 TICKERS = ["BTC"]
 LOOKBACK_PERIOD = 20000
 TOOL_NAMES: List[ToolName] = ['Range', 'Ichimoku',
                               'FibonacciRetracement', 'MARibbon', "VolumeProfile", 'Range']
+FETCH_CONCURRENCY = 4
+# Alpaca's free plan allows 200 requests per minute
+FETCH_REQUESTS_PER_MINUTE = 200
+INDICATOR_CACHE_MAX_MB = 256
+# Set to None to keep indicator results in memory only. Safe to delete, entries are recomputed
+INDICATOR_CACHE_DIR = "IndicatorCache"
+BACKTEST_DIR = "Backtests"
+# Fractions of the traded notional, per fill
+BACKTEST_FEE_RATE = 0.001
+BACKTEST_SLIPPAGE = 0.0005
@@ -1,4 +1,7 @@
-from typing import TypedDict, Literal
+from typing import TypedDict, Literal, List, Union
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
 
 
 class BarData(TypedDict):
@@ -11,3 +14,77 @@ class BarData(TypedDict):
 
 
 TimeframeString = Literal["1m", "15m", "30m", "1H", "4H", "1D", "1W", "1M"]
+
+BAR_COLUMNS = ("timestamp", "open", "high", "low", "close", "volume")
+
+
+@dataclass(eq=False)
+class BarSeries:
+    """Struct-of-arrays bars. Timestamps are int64 epoch-ns (UTC), OHLCV are float64."""
+    timestamp: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    def __post_init__(self):
+        # np.asarray keeps views (and memory maps) as they are when dtypes already match
+        self.timestamp = np.asarray(self.timestamp, dtype=np.int64)
+        for column in BAR_COLUMNS[1:]:
+            setattr(self, column, np.asarray(
+                getattr(self, column), dtype=np.float64))
+
+    @classmethod
+    def from_bar_dicts(cls, bars: List[BarData]) -> "BarSeries":
+        def column(name):
+            return np.fromiter((bar[name] for bar in bars), dtype=np.float64, count=len(bars))
+        timestamps = pd.to_datetime(
+            [bar['timestamp'] for bar in bars], utc=True, format='ISO8601')
+        return cls(timestamps.as_unit('ns').asi8, column('open'), column('high'),
+                   column('low'), column('close'), column('volume'))
+
+    @classmethod
+    def coerce(cls, bars: "Bars") -> "BarSeries":
+        return bars if isinstance(bars, BarSeries) else cls.from_bar_dicts(bars)
+
+    @classmethod
+    def concatenate(cls, series: List["BarSeries"]) -> "BarSeries":
+        if not series:
+            return cls.empty()
+        return cls(*(np.concatenate([getattr(bars, column) for bars in series]) for column in BAR_COLUMNS))
+
+    @classmethod
+    def empty(cls) -> "BarSeries":
+        return cls(*(np.empty(0) for _ in BAR_COLUMNS))
+
+    def to_bar_dicts(self) -> List[BarData]:
+        timestamps = [timestamp.isoformat()
+                      for timestamp in pd.to_datetime(self.timestamp, unit='ns', utc=True)]
+        return [dict(zip(BAR_COLUMNS, row)) for row in zip(
+            timestamps, self.open.tolist(), self.high.tolist(), self.low.tolist(),
+            self.close.tolist(), self.volume.tolist())]
+
+    @property
+    def datetimes(self) -> np.ndarray:
+        """Zero-copy datetime64[ns] view of the timestamps, e.g. for plotting."""
+        return self.timestamp.view('datetime64[ns]')
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __getitem__(self, key) -> Union["BarSeries", BarData]:
+        if isinstance(key, slice):
+            # Basic slicing returns views, no bar data is copied
+            return BarSeries(*(getattr(self, column)[key] for column in BAR_COLUMNS))
+        return {
+            "timestamp": pd.Timestamp(int(self.timestamp[key]), unit='ns', tz='UTC').isoformat(),
+            "open": float(self.open[key]),
+            "high": float(self.high[key]),
+            "low": float(self.low[key]),
+            "close": float(self.close[key]),
+            "volume": float(self.volume[key])
+        }
+
+
+Bars = Union[List[BarData], BarSeries]
@@ -0,0 +1,68 @@
+from data_types import Bars, BarSeries
+from typing import TYPE_CHECKING, Literal
+import numpy as np
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
+
+# SVG draws every point, WebGL decimates lines and candles down to max_points first
+RenderMode = Literal["SVG", "WebGL"]
+
+
+def get_min_max_indices(values: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Indices of the points to keep so a line of values still looks the same
+    with at most ~max_points points: the lowest and highest point of every
+    bucket, plus both ends. NaN gaps stay visible.
+    """
+    count = len(values)
+    if count <= max_points:
+        return np.arange(count)
+    bucket_size = -(-count // max(max_points // 2, 1))
+    bucket_count = -(-count // bucket_size)
+    padded = np.full(bucket_count * bucket_size, np.nan)
+    padded[:count] = values
+    buckets = padded.reshape(bucket_count, bucket_size)
+    is_nan = np.isnan(buckets)
+    offsets = np.arange(bucket_count) * bucket_size
+    # An all-NaN bucket gives its first index, which keeps the gap
+    lowest = np.where(is_nan, np.inf, buckets).argmin(axis=1) + offsets
+    highest = np.where(is_nan, -np.inf, buckets).argmax(axis=1) + offsets
+    indices = np.unique(np.concatenate(([0, count - 1], lowest, highest)))
+    return indices[indices < count]
+
+
+def aggregate_candles(bars: Bars, max_candles: int) -> BarSeries:
+    """Merges runs of consecutive bars so at most max_candles candles are left."""
+    bars = BarSeries.coerce(bars)
+    if len(bars) <= max_candles:
+        return bars
+    group_size = -(-len(bars) // max_candles)
+    starts = np.arange(0, len(bars), group_size)
+    ends = np.minimum(starts + group_size, len(bars))
+    return BarSeries(bars.timestamp[starts], bars.open[starts], np.maximum.reduceat(bars.high, starts),
+                     np.minimum.reduceat(bars.low, starts), bars.close[ends - 1],
+                     np.add.reduceat(bars.volume, starts))
+
+
+def decimate_figure(fig: "go.Figure", max_points: int):
+    """
+    Replaces every line trace in fig with a min/max decimated WebGL trace.
+    Traces with fewer points only switch to WebGL.
+    """
+    import plotly.graph_objects as go
+    traces = []
+    for trace in fig.data:
+        if not isinstance(trace, go.Scatter) or trace.y is None:
+            traces.append(trace)
+            continue
+        properties = trace.to_plotly_json()
+        properties.pop('type')
+        y = np.asarray(trace.y, dtype=np.float64)
+        indices = get_min_max_indices(y, max_points)
+        properties['x'] = np.asarray(trace.x)[indices]
+        properties['y'] = y[indices]
+        traces.append(go.Scattergl(properties))
+    fig.data = []
+    for trace in traces:
+        fig.add_trace(trace)
@@ -0,0 +1,116 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+from data_types import TimeframeString
+import random
+import threading
+import time
+
+# HTTP statuses a retry may get past, rate limiting and server side failures
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+@dataclass
+class FetchJob:
+    ticker: str
+    timeframe: TimeframeString
+
+
+@dataclass
+class FetchResult:
+    job: FetchJob
+    bar_count: int
+    seconds: float
+    error: Optional[str] = None
+
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second on average, bursting up to `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens +
+                                  (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether a failed request may succeed when retried, like a dropped connection or a 503."""
+    # Already imported by the SDK once a request has failed
+    import requests
+    if isinstance(error, (ConnectionError, TimeoutError, requests.ConnectionError, requests.Timeout)):
+        return True
+    # The SDK's APIError and requests' HTTPError both carry the response
+    return getattr(getattr(error, 'response', None), 'status_code', None) in RETRY_STATUS_CODES
+
+
+class ThrottledClient:
+    """
+    Wraps a CryptoHistoricalDataClient so every request shared between
+    threads takes a token first. Transient failures are retried with
+    exponential backoff, anything else, like a bad symbol or rejected keys,
+    is raised at once.
+    """
+
+    def __init__(self, client, bucket: TokenBucket, max_retries=3, backoff_seconds=1.0):
+        self.client = client
+        self.bucket = bucket
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+
+    def get_crypto_bars(self, request_params):
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            try:
+                return self.client.get_crypto_bars(request_params)
+            except Exception as error:
+                if attempt >= self.max_retries or not is_transient(error):
+                    raise
+                # Jitter keeps retrying threads from hitting the API in lockstep
+                time.sleep(self.backoff_seconds * 2 ** attempt *
+                           (1 + random.random()))
+                attempt += 1
+
+
+class FetchScheduler:
+    def __init__(self, fetch: Callable[[FetchJob], int], concurrency=4):
+        self.fetch = fetch
+        self.concurrency = max(concurrency, 1)
+
+    def run(self, jobs: List[FetchJob]) -> List[FetchResult]:
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            return list(executor.map(self.__run_job, jobs))
+
+    def __run_job(self, job: FetchJob) -> FetchResult:
+        started = time.perf_counter()
+        try:
+            bar_count = self.fetch(job)
+            return FetchResult(job, bar_count, time.perf_counter() - started)
+        except Exception as error:
+            return FetchResult(job, 0, time.perf_counter() - started, repr(error))
+
+
+def format_summary(results: List[FetchResult], wall_seconds: float):
+    lines = [f"{'Ticker':<10}{'Timeframe':<11}{'New bars':>10}{'Seconds':>10}  Status"]
+    for result in results:
+        lines.append(f"{result.job.ticker:<10}{result.job.timeframe:<11}{result.bar_count:>10}"
+                     f"{result.seconds:>10.2f}  {result.error or 'OK'}")
+    job_seconds = sum(result.seconds for result in results)
+    lines.append(
+        f"{len(results)} jobs, {job_seconds:.2f}s of fetching in {wall_seconds:.2f}s wall time")
+    return "\n".join(lines)
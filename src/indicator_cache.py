@@ -0,0 +1,166 @@
+from collections import OrderedDict
+from typing import Optional
+from data_types import BAR_COLUMNS, Bars, BarSeries
+import numpy as np
+import functools
+import hashlib
+import inspect
+import pickle
+import os
+
+
+def get_bars_digest(bars: BarSeries) -> str:
+    """Content hash of the bars, any change to a value or the range changes it."""
+    digest = hashlib.blake2b(digest_size=16)
+    for column in BAR_COLUMNS:
+        digest.update(np.ascontiguousarray(getattr(bars, column)).data)
+    return digest.hexdigest()
+
+
+@functools.lru_cache(maxsize=None)
+def get_code_digest(dirname: str) -> str:
+    """
+    Content hash of every module in dirname. Tools share helpers like the
+    rolling windows, so any change to the package invalidates every tool's
+    entries instead of serving results of the old code.
+    """
+    digest = hashlib.blake2b(digest_size=8)
+    for file_name in sorted(os.listdir(dirname)):
+        if file_name.endswith('.py'):
+            with open(os.path.join(dirname, file_name), "rb") as file:
+                digest.update(file.read())
+    return digest.hexdigest()
+
+
+def estimate_size(value) -> int:
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return 64 + sum(estimate_size(key) + estimate_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return 56 + sum(estimate_size(item) for item in value)
+    return 32
+
+
+class IndicatorCache:
+    """
+    Caches calculate_historical_data results keyed on (tool name, config, tool
+    package code digest, bars digest). Memory entries are evicted least recently
+    used first once max_bytes is exceeded. With a dirname, entries are also
+    pickled to disk, bounded by max_disk_bytes. Entries of older code are never
+    hit again and age out of the disk like any other, delete dirname to clear
+    them at once. Cached values are shared between hits, treat them as read-only.
+    """
+
+    def __init__(self, max_bytes=256 * 1024 * 1024, dirname: Optional[str] = None, max_disk_bytes=1024 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.dirname = dirname
+        self.max_disk_bytes = max_disk_bytes
+        self.entries: OrderedDict[str, tuple] = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_key(self, tool, bars: BarSeries) -> str:
+        # Dataclass reprs list every field, so any config change is a new key
+        config = repr(getattr(tool, 'config', None)).encode()
+        config_digest = hashlib.blake2b(config, digest_size=8).hexdigest()
+        code_digest = get_code_digest(os.path.dirname(inspect.getfile(type(tool))))
+        return f"{type(tool).__name__}-{config_digest}-{code_digest}-{get_bars_digest(bars)}"
+
+    def get_or_compute(self, tool, bars: Bars):
+        """calculate_historical_data, restoring the tool's cached attributes on a hit."""
+        bars = BarSeries.coerce(bars)
+        key = self.get_key(tool, bars)
+        if key in self.entries:
+            self.entries.move_to_end(key)
+            entry = self.entries[key][0]
+            self.hits += 1
+        else:
+            entry = self.__read_disk(key)
+            if entry is not None:
+                self.disk_hits += 1
+            else:
+                self.misses += 1
+                result = tool.calculate_historical_data(bars)
+                entry = (result, {attribute: getattr(tool, attribute)
+                                  for attribute in tool.cached_attributes})
+                self.__write_disk(key, entry)
+            self.__put(key, entry)
+        result, attributes = entry
+        for attribute, value in attributes.items():
+            setattr(tool, attribute, value)
+        return result
+
+    def get_stats(self):
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.entries),
+            'bytes': self.size,
+        }
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def __put(self, key: str, entry: tuple):
+        entry_size = estimate_size(entry)
+        self.entries[key] = (entry, entry_size)
+        self.size += entry_size
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, (_, evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+            self.evictions += 1
+
+    def __get_disk_path(self, key: str):
+        return os.path.join(self.dirname, f"{key}.pkl")
+
+    def __read_disk(self, key: str):
+        if not self.dirname or not os.path.exists(self.__get_disk_path(key)):
+            return None
+        path = self.__get_disk_path(key)
+        try:
+            # Bump the modification time, disk eviction goes least recently used first too
+            os.utime(path)
+            with open(path, "rb") as file:
+                return pickle.load(file)
+        except FileNotFoundError:
+            # Evicted by another process since the check
+            return None
+
+    def __write_disk(self, key: str, entry: tuple):
+        if not self.dirname:
+            return
+        os.makedirs(self.dirname, exist_ok=True)
+        # Per process, workers of a pool may share dirname
+        temp_path = f"{self.__get_disk_path(key)}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            pickle.dump(entry, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.__get_disk_path(key))
+        self.__evict_disk()
+
+    def __evict_disk(self):
+        files = []
+        for file_name in os.listdir(self.dirname):
+            if file_name.endswith('.pkl'):
+                try:
+                    stat = os.stat(os.path.join(self.dirname, file_name))
+                except FileNotFoundError:
+                    # Evicted by another process in between
+                    continue
+                files.append((stat.st_mtime, stat.st_size, os.path.join(self.dirname, file_name)))
+        files.sort()
+        disk_size = sum(size for _, size, _ in files)
+        for _, size, file in files:
+            if disk_size <= self.max_disk_bytes:
+                break
+            disk_size -= size
+            try:
+                os.remove(file)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,150 @@
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, Iterator, List, Optional, Tuple, TypedDict
+from data_types import BarData, Bars, BarSeries
+from toolbox import ToolName
+from toolbox.tool_base import ToolBase
+from toolbox.fib_retrace import NO_LEVEL
+import numpy as np
+import threading
+import queue
+import time
+
+# Bars are converted to dicts this many at a time while replaying
+REPLAY_CHUNK_SIZE = 1000
+
+
+class LiveSignal(TypedDict):
+    timestamp: str
+    close: float
+    # 1 long, -1 short, 0 flat
+    signal: int
+    # From the bar arriving to the signal being ready
+    latency_seconds: float
+
+
+class BarSource(ABC):
+    """A stream of closed bars, each paired with the perf_counter time it arrived at."""
+
+    @abstractmethod
+    def bars(self) -> Iterator[Tuple[BarData, float]]:
+        """Blocks until the next bar arrives, ends when the stream does."""
+        pass
+
+    def close(self):
+        pass
+
+
+class ReplaySource(BarSource):
+    """Replays stored bars, as fast as possible or one every interval_seconds."""
+
+    def __init__(self, bars: Bars, interval_seconds=0.0):
+        self.replayed = BarSeries.coerce(bars)
+        self.interval_seconds = interval_seconds
+
+    def bars(self):
+        for start in range(0, len(self.replayed), REPLAY_CHUNK_SIZE):
+            for bar in self.replayed[start:start + REPLAY_CHUNK_SIZE].to_bar_dicts():
+                if self.interval_seconds:
+                    time.sleep(self.interval_seconds)
+                yield bar, time.perf_counter()
+
+
+class AlpacaStreamSource(BarSource):
+    """Minute bars from Alpaca's crypto websocket, which needs API keys unlike historical data."""
+
+    def __init__(self, symbol: str, api_key: str, secret_key: str):
+        from alpaca.data.live import CryptoDataStream
+        self.queue: queue.Queue = queue.Queue()
+        self.stream = CryptoDataStream(api_key, secret_key)
+        self.stream.subscribe_bars(self.__on_bar, symbol)
+        # The stream runs its own event loop, bars are handed over through the queue
+        self.thread = threading.Thread(target=self.stream.run, daemon=True)
+
+    def bars(self):
+        self.thread.start()
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            yield item
+
+    def close(self):
+        self.stream.stop()
+        self.queue.put(None)
+
+    async def __on_bar(self, bar):
+        self.queue.put(({
+            "timestamp": bar.timestamp.isoformat(),
+            "open": float(bar.open),
+            "high": float(bar.high),
+            "low": float(bar.low),
+            "close": float(bar.close),
+            "volume": float(bar.volume)
+        }, time.perf_counter()))
+
+
+def get_signal(values: Dict[ToolName, object]) -> int:
+    """
+    Strategy1's rule on a single timeframe: long inside a support range and
+    short inside a resistance range when the close sits on a key fib level
+    and the fastest MA agrees with the slowest.
+    """
+    if not all(name in values for name in ('Range', 'FibonacciRetracement', 'MARibbon')):
+        return 0
+    level_type = values['Range']
+    moving_averages = values['MARibbon']
+    if values['FibonacciRetracement'] == NO_LEVEL or not level_type:
+        return 0
+    if level_type == 'Support' and moving_averages[0] > moving_averages[-1]:
+        return 1
+    if level_type == 'Resistance' and moving_averages[0] < moving_averages[-1]:
+        return -1
+    return 0
+
+
+class LiveRunner:
+    def __init__(self, tools: Dict[ToolName, ToolBase]):
+        self.tools = tools
+        self.signal = 0
+        self.latencies: List[float] = []
+
+    def warm_up(self, bars: Bars):
+        """Feed history through update so the first live bar continues from it."""
+        for tool in self.tools.values():
+            tool.get_latest_data(bars)
+
+    def on_bar(self, bar: BarData, received: float) -> Optional[LiveSignal]:
+        """Update every tool with the bar, returns a signal when it changes."""
+        values = {name: tool.update(bar) for name, tool in self.tools.items()}
+        signal = get_signal(values)
+        latency = time.perf_counter() - received
+        self.latencies.append(latency)
+        if signal == self.signal:
+            return None
+        self.signal = signal
+        return {'timestamp': bar['timestamp'], 'close': bar['close'],
+                'signal': signal, 'latency_seconds': latency}
+
+    def run(self, source: BarSource, on_signal: Callable[[LiveSignal], None], max_bars: Optional[int] = None):
+        try:
+            for bar, received in source.bars():
+                live_signal = self.on_bar(bar, received)
+                if live_signal:
+                    on_signal(live_signal)
+                if max_bars and len(self.latencies) >= max_bars:
+                    break
+        finally:
+            source.close()
+
+    def get_latency_stats(self) -> Dict[str, float]:
+        """Bar to signal latency in microseconds."""
+        if not self.latencies:
+            return {'bars': 0}
+        latencies = np.array(self.latencies) * 1e6
+        return {
+            'bars': len(latencies),
+            'mean_us': float(latencies.mean()),
+            'p50_us': float(np.percentile(latencies, 50)),
+            'p99_us': float(np.percentile(latencies, 99)),
+            'max_us': float(latencies.max()),
+        }
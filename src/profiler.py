@@ -0,0 +1,134 @@
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from functools import wraps
+from typing import Dict, List, Optional
+import cProfile
+import threading
+import tracemalloc
+import json
+import time
+import os
+
+
+@dataclass
+class StageStats:
+    # Names of the enclosing stages and this one, joined by " > "
+    stage: str
+    calls: int = 0
+    seconds: float = 0.0
+    max_seconds: float = 0.0
+    # Highest memory allocated on top of what was in use when the stage started
+    peak_bytes: int = 0
+
+
+class Profiler:
+    """
+    Times named stages and the memory they allocate. Disabled until enable is
+    called, stages then cost next to nothing. Stages nest per thread, the
+    report keys them by their full path so a tool's time shows up under the
+    stage that called it. Allocations are traced process wide, so stages
+    overlapping on other threads inflate each other's peaks.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.stats: Dict[str, StageStats] = {}
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.started = 0.0
+        self.use_cprofile = False
+        # cProfile of the slowest outermost stage as (seconds, stage, profile)
+        self.slowest_profile: Optional[tuple] = None
+
+    def enable(self, use_cprofile=False):
+        self.enabled = True
+        self.use_cprofile = use_cprofile
+        self.stats = {}
+        self.slowest_profile = None
+        self.started = time.perf_counter()
+        tracemalloc.start()
+
+    def disable(self):
+        self.enabled = False
+        tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        if not hasattr(self.local, 'stack'):
+            self.local.stack = []
+        # [name, start time, bytes in use at the start, highest peak seen so far]
+        stack: List[list] = self.local.stack
+        if stack:
+            stack[-1][3] = max(stack[-1][3], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        # Only one cProfile can run at a time, so only outermost stages on the main thread get one
+        profile = None
+        if self.use_cprofile and not stack and threading.current_thread() is threading.main_thread():
+            profile = cProfile.Profile()
+        path = " > ".join([entry[0] for entry in stack] + [name])
+        entry = [name, time.perf_counter(), tracemalloc.get_traced_memory()[0], 0]
+        stack.append(entry)
+        if profile:
+            profile.enable()
+        try:
+            yield
+        finally:
+            if profile:
+                profile.disable()
+            seconds = time.perf_counter() - entry[1]
+            peak = max(entry[3], tracemalloc.get_traced_memory()[1])
+            stack.pop()
+            if stack:
+                stack[-1][3] = max(stack[-1][3], peak)
+            tracemalloc.reset_peak()
+            self.__record(path, seconds, peak - entry[2])
+            if profile and (not self.slowest_profile or seconds > self.slowest_profile[0]):
+                self.slowest_profile = (seconds, path, profile)
+
+    def timed(self, name: Optional[str] = None):
+        """Decorator running every call of the function as a stage, named after it by default."""
+        def decorator(function):
+            stage_name = name or function.__qualname__
+
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                with self.stage(stage_name):
+                    return function(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def get_report(self):
+        with self.lock:
+            stages = sorted((asdict(stats) for stats in self.stats.values()),
+                            key=lambda stats: stats['seconds'], reverse=True)
+        return {
+            'wall_seconds': time.perf_counter() - self.started,
+            'stages': stages,
+            'slowest_profiled_stage': self.slowest_profile[1] if self.slowest_profile else None,
+        }
+
+    def write_report(self, path: str, cprofile_path: Optional[str] = None):
+        """Write the JSON report, and the slowest outermost stage's cProfile stats if collected."""
+        report = self.get_report()
+        if cprofile_path and self.slowest_profile:
+            os.makedirs(os.path.dirname(cprofile_path) or '.', exist_ok=True)
+            self.slowest_profile[2].dump_stats(cprofile_path)
+            report['cprofile_path'] = cprofile_path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, "w") as file:
+            json.dump(report, file, indent=2)
+
+    def __record(self, path: str, seconds: float, allocated: int):
+        with self.lock:
+            stats = self.stats.setdefault(path, StageStats(path))
+            stats.calls += 1
+            stats.seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.peak_bytes = max(stats.peak_bytes, allocated)
+
+
+# Shared by every module, enabled by the CLI's --profile option
+profiler = Profiler()
@@ -0,0 +1,62 @@
+from data_types import Bars, BarSeries, TimeframeString
+from bar_store import BarStore
+from profiler import profiler
+import numpy as np
+
+MINUTE = 60 * 1_000_000_000
+# Fixed bucket lengths in ns, 1M follows the calendar instead
+BUCKET_LENGTHS = {
+    "1m": MINUTE,
+    "15m": 15 * MINUTE,
+    "30m": 30 * MINUTE,
+    "1H": 60 * MINUTE,
+    "4H": 4 * 60 * MINUTE,
+    "1D": 24 * 60 * MINUTE,
+    "1W": 7 * 24 * 60 * MINUTE,
+}
+# The epoch is a Thursday, weeks start on Monday 00:00 UTC
+WEEK_OFFSET = 3 * 24 * 60 * MINUTE
+
+
+def get_bucket_starts(timestamps: np.ndarray, timeframe: TimeframeString) -> np.ndarray:
+    """Epoch-ns start of the timeframe bar every timestamp falls in, in UTC."""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if timeframe == "1M":
+        return timestamps.view('datetime64[ns]').astype('datetime64[M]').astype('datetime64[ns]').view(np.int64)
+    length = BUCKET_LENGTHS[timeframe]
+    offset = WEEK_OFFSET if timeframe == "1W" else 0
+    return (timestamps + offset) // length * length - offset
+
+
+def resample(bars: Bars, timeframe: TimeframeString) -> BarSeries:
+    """
+    Aggregates sorted bars into timeframe bars in one vectorized pass. A bar is
+    stamped with the start of its bucket, the last one may still be open.
+    """
+    bars = BarSeries.coerce(bars)
+    if not len(bars):
+        return BarSeries.empty()
+    buckets = get_bucket_starts(bars.timestamp, timeframe)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(buckets)) + 1))
+    ends = np.concatenate((starts[1:], [len(bars)]))
+    return BarSeries(buckets[starts], bars.open[starts], np.maximum.reduceat(bars.high, starts),
+                     np.minimum.reduceat(bars.low, starts), bars.close[ends - 1],
+                     np.add.reduceat(bars.volume, starts))
+
+
+@profiler.timed()
+def resample_into_store(store: BarStore, ticker: str, timeframe: TimeframeString, base_timeframe: TimeframeString = "1m", full=False) -> int:
+    """
+    Builds the stored timeframe series from the stored base series. Unless
+    full, only the last stored bucket, which may have been open, and the ones
+    after it are recomputed. Returns the number of bars added to the series.
+    """
+    base = store.read(ticker, base_timeframe)
+    last_timestamp = None if full else store.get_last_timestamp(ticker, timeframe)
+    # A series fetched with other bucket boundaries can't be extended, rebuild it
+    if last_timestamp is None or get_bucket_starts(np.array([last_timestamp]), timeframe)[0] != last_timestamp:
+        bars = resample(base, timeframe)
+        store.write(ticker, timeframe, bars)
+        return len(bars)
+    start = int(np.searchsorted(base.timestamp, last_timestamp))
+    return store.append(ticker, timeframe, resample(base[start:], timeframe))
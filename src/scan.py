@@ -0,0 +1,137 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from typing import Iterator, List, Optional
+from data_types import BAR_COLUMNS, BarSeries, TimeframeString
+from bar_store import BarStore
+from indicator_cache import IndicatorCache
+from toolbox import FibonacciRetracement, PotentialRange
+from toolbox.range import LevelType
+from toolbox.fib_retrace import NO_LEVEL
+import time
+import numpy as np
+
+
+@dataclass
+class ScanJob:
+    timeframe: TimeframeString
+    store_dirname: str
+    # Bars per ticker the tools run over, the latest ones
+    lookback: int
+    # Shared by the workers' IndicatorCaches, so a ticker without new bars is served from disk on the next scan
+    cache_dirname: Optional[str] = None
+
+
+@dataclass
+class ScanResult:
+    ticker: str
+    bars: int = 0
+    timestamp: Optional[str] = None
+    close: float = 0.0
+    # Type of the validated range the last close is in, if any
+    level_type: Optional[LevelType] = None
+    # Level % of the fib level the last close is near, if any
+    fib_level: Optional[float] = None
+    load_seconds: float = 0.0
+    compute_seconds: float = 0.0
+    error: Optional[str] = None
+
+    @property
+    def signal(self) -> Optional[LevelType]:
+        """The range type when the last close is inside a validated range and near a fib level."""
+        return self.level_type if self.fib_level is not None else None
+
+
+# Per worker process state, set once by _init_worker
+worker_job: Optional[ScanJob] = None
+worker_store: Optional[BarStore] = None
+worker_cache: Optional[IndicatorCache] = None
+
+
+def _init_worker(job: ScanJob):
+    global worker_job, worker_store, worker_cache
+    worker_job = job
+    worker_store = BarStore(job.store_dirname)
+    worker_cache = IndicatorCache(dirname=job.cache_dirname)
+
+
+def _load_bars(ticker: str, result: ScanResult) -> Optional[BarSeries]:
+    started = time.perf_counter()
+    try:
+        bars = worker_store.read(ticker, worker_job.timeframe, last=worker_job.lookback)
+        # Copied out of the memory map so the whole batch is paged in before any tool runs
+        bars = BarSeries(*(np.array(getattr(bars, column)) for column in BAR_COLUMNS))
+    except Exception as error:
+        result.error = repr(error)
+        return None
+    finally:
+        result.load_seconds = time.perf_counter() - started
+    result.bars = len(bars)
+    return bars
+
+
+def _scan_bars(bars: BarSeries, result: ScanResult):
+    started = time.perf_counter()
+    try:
+        last_bar = bars[-1]
+        result.timestamp = last_bar['timestamp']
+        result.close = last_bar['close']
+        potential_range = PotentialRange()
+        potential_range.cache = worker_cache
+        result.level_type = potential_range.get_historical_data(bars)[-1]
+        fibonacci_retracement = FibonacciRetracement()
+        fibonacci_retracement.cache = worker_cache
+        level_index = fibonacci_retracement.get_historical_data(bars)[-1]
+        if level_index != NO_LEVEL:
+            result.fib_level = fibonacci_retracement.levels[level_index]
+    except Exception as error:
+        result.error = repr(error)
+    finally:
+        result.compute_seconds = time.perf_counter() - started
+
+
+def _scan_batch(tickers: List[str]) -> List[ScanResult]:
+    results = [ScanResult(ticker) for ticker in tickers]
+    batch = [_load_bars(ticker, result) for ticker, result in zip(tickers, results)]
+    for bars, result in zip(batch, results):
+        if bars is not None and len(bars):
+            _scan_bars(bars, result)
+    return results
+
+
+def run_scan(job: ScanJob, tickers: List[str], workers=None, batch_size=16) -> Iterator[ScanResult]:
+    """
+    Scans every ticker on a process pool, yielding results as they finish.
+    Tickers are sent in batches so a worker round trip covers several of them.
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(job,)) as executor:
+        futures = [executor.submit(_scan_batch, tickers[start:start + batch_size])
+                   for start in range(0, len(tickers), batch_size)]
+        for future in as_completed(futures):
+            yield from future.result()
+
+
+def format_result(result: ScanResult):
+    if result.error:
+        return f"{result.ticker:<12}{'error':>10}  {result.error}"
+    return (f"{result.ticker:<12}{result.signal or '-':>10}{result.level_type or '-':>12}"
+            f"{result.fib_level if result.fib_level is not None else '-':>6}{result.close:>14.4f}  {result.timestamp}")
+
+
+def format_table(results: List[ScanResult], show_all=False):
+    """Signals first, then the other tickers when show_all, failed ones last."""
+    lines = [f"{'Ticker':<12}{'Signal':>10}{'Range':>12}{'Fib':>6}{'Close':>14}  Last bar"]
+    results = sorted(results, key=lambda result: (result.error is not None,
+                                                  result.signal is None, result.ticker))
+    lines += [format_result(result) for result in results
+              if show_all or result.signal or result.error]
+    return "\n".join(lines)
+
+
+def format_summary(results: List[ScanResult], seconds: float):
+    signals = sum(1 for result in results if result.signal)
+    errors = sum(1 for result in results if result.error)
+    load_seconds = sum(result.load_seconds for result in results)
+    compute_seconds = sum(result.compute_seconds for result in results)
+    rate = len(results) / seconds if seconds else 0
+    return (f"Scanned {len(results)} tickers in {seconds:.2f}s ({rate:.1f}/s), {signals} signals, {errors} errors. "
+            f"Worker time: loading {load_seconds:.2f}s, tools {compute_seconds:.2f}s")
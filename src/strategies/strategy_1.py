@@ -1,31 +1,64 @@
-from data_types import BarData
-from typing import List
+from data_types import Bars, BarSeries
 from toolbox import MARibbon, FibonacciRetracement, PotentialRange
+from toolbox.ma_ribbon import MARibbonConfig
+from toolbox.fib_retrace import NO_LEVEL, FibonacciRetracementConfig
+from toolbox.range import RangeConfig
+from toolbox.features import FeatureSet
+from indicator_cache import IndicatorCache
+from backtest import BacktestConfig, BacktestResult, align, hold_until, run_backtest
+from typing import Optional, Sequence
+import numpy as np
 
 
 class Strategy1():
-    # Assuming data
-    def backtest(self, bars_low_timeframe: List[BarData], bars_high_timeframe: List[BarData]):
-        timeframe_ratio = round(
-            len(bars_low_timeframe) / len(bars_high_timeframe))
-        tool = MARibbon()
-        ma_data, ma_periods = tool.calculate_historical_data(
+    def __init__(self, cache: Optional[IndicatorCache] = None, config: Optional[BacktestConfig] = None,
+                 ma_config: Optional[MARibbonConfig] = None, fib_config: Optional[FibonacciRetracementConfig] = None,
+                 range_config: Optional[RangeConfig] = None, feature_sets: Sequence[FeatureSet] = ()):
+        self.cache = cache
+        # FeatureSets of the bars backtested, shared with other strategies over the same bars
+        self.feature_sets = feature_sets
+        self.config = config
+        self.ma_config = ma_config
+        self.fib_config = fib_config
+        self.range_config = range_config
+
+    def get_signals(self, bars_low_timeframe: Bars, bars_high_timeframe: Bars) -> np.ndarray:
+        """
+        Target position per low timeframe bar. Goes long inside a support range
+        and short inside a resistance range when the close sits on a key fib
+        level and the MA ribbon agrees, holding until the range is left.
+        """
+        bars_low_timeframe = BarSeries.coerce(bars_low_timeframe)
+        bars_high_timeframe = BarSeries.coerce(bars_high_timeframe)
+        tool = MARibbon(self.ma_config)
+        tool.cache = self.cache
+        tool.features = self.__get_feature_set(bars_low_timeframe)
+        ma_data, ma_periods = tool.get_historical_data(
             bars_low_timeframe)
-        tool = FibonacciRetracement()
-        fibonacci_retracement_array = tool.calculate_historical_data(
+        tool = FibonacciRetracement(self.fib_config)
+        tool.cache = self.cache
+        tool.features = self.__get_feature_set(bars_high_timeframe)
+        fibonacci_retracement_array = tool.get_historical_data(
             bars_high_timeframe)
-        tool = PotentialRange()
-        range_data_array = tool.calculate_historical_data(bars_high_timeframe)
-        for i in range(len(bars_high_timeframe)):
-            is_within_fib_level = fibonacci_retracement_array[i]
-            level_type = range_data_array[i]
-            # currently no data to parse since being within key fib level AND within a range is a rarity
-            if is_within_fib_level and level_type:
-                start_index = i * timeframe_ratio
-                end_index = (i+1) * timeframe_ratio
-                if level_type == 'Resistance':
-                    for j in range(start_index, end_index):
-                        print(f'do whatever we want with ma_data[start_index:end_index] for {level_type} level')
-                else:
-                    for j in range(start_index, end_index):
-                        print(f'do whatever we want with ma_data[start_index:end_index] for {level_type} level')
+        tool = PotentialRange(self.range_config)
+        tool.cache = self.cache
+        range_data_array = tool.get_historical_data(bars_high_timeframe)
+
+        # Only use a high timeframe bar once it has closed
+        is_within_fib_level = align(fibonacci_retracement_array, bars_high_timeframe.timestamp,
+                                    bars_low_timeframe.timestamp, fill=NO_LEVEL) != NO_LEVEL
+        level_types = align(range_data_array, bars_high_timeframe.timestamp,
+                            bars_low_timeframe.timestamp)
+        # Periods are sorted, compare the fastest MA against the slowest
+        is_uptrend = ma_data[0] > ma_data[-1]
+        is_downtrend = ma_data[0] < ma_data[-1]
+        entries = np.where(is_within_fib_level & (level_types == 'Support') & is_uptrend, 1,
+                           np.where(is_within_fib_level & (level_types == 'Resistance') & is_downtrend, -1, 0))
+        exits = np.equal(level_types, None)
+        return hold_until(entries, exits)
+
+    def __get_feature_set(self, bars: BarSeries) -> Optional[FeatureSet]:
+        return next((feature_set for feature_set in self.feature_sets if feature_set.bars is bars), None)
+
+    def backtest(self, bars_low_timeframe: Bars, bars_high_timeframe: Bars) -> BacktestResult:
+        return run_backtest(bars_low_timeframe, self.get_signals(bars_low_timeframe, bars_high_timeframe), self.config)
@@ -0,0 +1,148 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, fields, replace
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from data_types import TimeframeString
+from bar_store import BarStore
+from indicator_cache import IndicatorCache
+from backtest import BacktestConfig
+from strategies import Strategy1
+from toolbox.ma_ribbon import MARibbonConfig
+from toolbox.fib_retrace import FibonacciRetracementConfig
+from toolbox.range import RangeConfig
+from toolbox.features import FeatureSet
+import itertools
+import json
+import time
+
+# Tool name -> (config class, Strategy1 keyword the config is passed as)
+SWEEP_CONFIGS = {
+    'Range': (RangeConfig, 'range_config'),
+    'FibonacciRetracement': (FibonacciRetracementConfig, 'fib_config'),
+    'MARibbon': (MARibbonConfig, 'ma_config'),
+}
+# Stats where a lower value ranks higher
+LOWER_IS_BETTER = ('max_drawdown_pct', 'fees')
+
+# "Tool.field" -> value, one point of the grid
+Params = Dict[str, Any]
+
+
+@dataclass
+class SweepJob:
+    ticker: str
+    low_timeframe: TimeframeString
+    high_timeframe: TimeframeString
+    store_dirname: str
+    backtest_config: BacktestConfig
+
+
+@dataclass
+class SweepResult:
+    params: Params
+    stats: Dict[str, float]
+    seconds: float
+    error: Optional[str] = None
+
+
+def parse_param(text: str) -> Tuple[str, List[Any]]:
+    """
+    Parses "Tool.field=values" where values is a JSON list, e.g.
+    "MARibbon.periods=[[5, 20], [10, 50]]", or comma separated, e.g.
+    "Range.lookback_period=20,50,100".
+    """
+    name, _, values = text.partition('=')
+    tool_name, _, field_name = name.strip().partition('.')
+    if tool_name not in SWEEP_CONFIGS:
+        raise ValueError(
+            f"Unknown tool {tool_name!r}, expected one of {', '.join(SWEEP_CONFIGS)}")
+    config_class = SWEEP_CONFIGS[tool_name][0]
+    if field_name not in {config_field.name for config_field in fields(config_class)}:
+        raise ValueError(f"{config_class.__name__} has no field {field_name!r}")
+    values = values.strip()
+    if values.startswith('['):
+        return name.strip(), json.loads(values)
+    return name.strip(), [_parse_value(value) for value in values.split(',')]
+
+
+def _parse_value(value: str):
+    try:
+        return json.loads(value)
+    except json.JSONDecodeError:
+        return value.strip()
+
+
+def get_combinations(grid: Dict[str, List[Any]]) -> List[Params]:
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*grid.values())]
+
+
+def get_strategy_configs(params: Params) -> Dict[str, Any]:
+    """Strategy1 keyword arguments for one point of the grid."""
+    configs = {}
+    for name, value in params.items():
+        tool_name, field_name = name.split('.', 1)
+        config_class, keyword = SWEEP_CONFIGS[tool_name]
+        configs[keyword] = replace(
+            configs.get(keyword) or config_class(), **{field_name: value})
+    return configs
+
+
+# Per worker process state, set once by _init_worker
+worker_job: Optional[SweepJob] = None
+worker_bars = None
+worker_cache: Optional[IndicatorCache] = None
+worker_feature_sets: Tuple[FeatureSet, ...] = ()
+
+
+def _init_worker(job: SweepJob):
+    global worker_job, worker_bars, worker_cache, worker_feature_sets
+    worker_job = job
+    # Memory mapped, so every worker shares the page cache instead of getting a pickled copy
+    store = BarStore(job.store_dirname)
+    worker_bars = (store.read(job.ticker, job.low_timeframe),
+                   store.read(job.ticker, job.high_timeframe))
+    # Combinations that only differ in one tool's config reuse the other tools' results
+    worker_cache = IndicatorCache()
+    # Combinations with different configs of a tool still share its rolling windows, e.g. MA periods
+    worker_feature_sets = tuple(FeatureSet(bars) for bars in worker_bars)
+
+
+def _run_combination(params: Params) -> SweepResult:
+    started = time.perf_counter()
+    try:
+        strategy = Strategy1(worker_cache, worker_job.backtest_config,
+                             feature_sets=worker_feature_sets, **get_strategy_configs(params))
+        result = strategy.backtest(*worker_bars)
+        return SweepResult(params, result.stats, time.perf_counter() - started)
+    except Exception as error:
+        return SweepResult(params, {}, time.perf_counter() - started, repr(error))
+
+
+def run_sweep(job: SweepJob, combinations: List[Params], workers=None) -> Iterator[SweepResult]:
+    """Backtests every combination on a process pool, yielding results as they finish."""
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(job,)) as executor:
+        futures = [executor.submit(_run_combination, params)
+                   for params in combinations]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def rank(results: List[SweepResult], metric: str) -> List[SweepResult]:
+    """Best first, failed combinations last."""
+    sign = 1 if metric in LOWER_IS_BETTER else -1
+    return sorted(results, key=lambda result: (result.error is not None,
+                                               sign * result.stats.get(metric, 0)))
+
+
+def format_result(result: SweepResult, metric: str):
+    params = ', '.join(f"{name}={value}" for name, value in result.params.items())
+    if result.error:
+        return f"{'error':>10}  {params}  {result.error}"
+    return (f"{result.stats[metric]:>10.3f}{result.stats['trades']:>8}"
+            f"{result.stats['total_return_pct']:>10.2f}{result.seconds:>9.2f}  {params}")
+
+
+def format_table(results: List[SweepResult], metric: str):
+    lines = [f"{metric:>10}{'Trades':>8}{'Return %':>10}{'Seconds':>9}  Params"]
+    lines += [format_result(result, metric) for result in rank(results, metric)]
+    return "\n".join(lines)
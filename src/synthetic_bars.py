@@ -0,0 +1,32 @@
+from data_types import BarSeries
+import numpy as np
+
+# (per-bar volatility, per-bar drift) of the regimes the walk switches between
+REGIMES = [(0.002, 0.0), (0.006, 0.0), (0.004, 0.0004), (0.004, -0.0004), (0.015, 0.0)]
+
+
+def generate_bars(count: int, seed=0, interval_seconds=60, start_price=30000.0, regime_length=500) -> BarSeries:
+    """
+    Seeded random-walk OHLCV bars. The walk switches between calm, trending and
+    volatile regimes every ~regime_length bars, so swings and ranges form the way
+    they do on real charts.
+    """
+    rng = np.random.default_rng(seed)
+    # Enough regimes to cover count bars even if every one is the shortest possible
+    min_length = max(regime_length // 2, 1)
+    regime_count = count // min_length + 1
+    regimes = rng.integers(len(REGIMES), size=regime_count)
+    lengths = rng.integers(min_length, regime_length * 3 // 2 + 1, size=regime_count)
+    regime_per_bar = np.repeat(regimes, lengths)[:count]
+    volatility = np.array([regime[0] for regime in REGIMES])[regime_per_bar]
+    drift = np.array([regime[1] for regime in REGIMES])[regime_per_bar]
+
+    closes = start_price * np.exp(np.cumsum(drift + volatility * rng.standard_normal(count)))
+    opens = np.concatenate(([start_price], closes[:-1]))
+    wicks = np.abs(rng.standard_normal((2, count))) * volatility / 2
+    highs = np.maximum(opens, closes) * (1 + wicks[0])
+    lows = np.minimum(opens, closes) * (1 - wicks[1])
+    volumes = rng.lognormal(3, 1, count) * (1 + volatility * 100)
+    start = np.datetime64('2021-01-01T00:00:00', 'ns').astype(np.int64)
+    timestamps = start + np.arange(count, dtype=np.int64) * interval_seconds * 1_000_000_000
+    return BarSeries(timestamps, opens, highs, lows, closes, volumes)
@@ -1,8 +1,44 @@
-from typing import Literal
-from .fib_retrace import FibonacciRetracement
-from .ma_ribbon import MARibbon
-from .range import PotentialRange
-from .ichimoku import Ichimoku
-from .vol_profile import VolumeProfile
+from typing import TYPE_CHECKING, Dict, Literal, Tuple, Type
+import importlib
+
+if TYPE_CHECKING:
+    from .tool_base import ToolBase
+    from .fib_retrace import FibonacciRetracement
+    from .ma_ribbon import MARibbon
+    from .range import PotentialRange
+    from .ichimoku import Ichimoku
+    from .vol_profile import VolumeProfile
+
 ToolName = Literal["Range", "Ichimoku",
                    "FibonacciRetracement", "MARibbon", "VolumeProfile"]
+
+# Tool name -> (module, class), a tool's module is only imported once it is used
+TOOL_REGISTRY: Dict[ToolName, Tuple[str, str]] = {
+    'Range': ('toolbox.range', 'PotentialRange'),
+    'Ichimoku': ('toolbox.ichimoku', 'Ichimoku'),
+    'FibonacciRetracement': ('toolbox.fib_retrace', 'FibonacciRetracement'),
+    'MARibbon': ('toolbox.ma_ribbon', 'MARibbon'),
+    'VolumeProfile': ('toolbox.vol_profile', 'VolumeProfile'),
+}
+TOOL_NAMES_BY_CLASS = {class_name: tool_name for tool_name, (_, class_name) in TOOL_REGISTRY.items()}
+
+
+def get_tool_class(tool_name: ToolName) -> Type["ToolBase"]:
+    if tool_name not in TOOL_REGISTRY:
+        raise ValueError(f"Invalid tool name: {tool_name}")
+    module_name, class_name = TOOL_REGISTRY[tool_name]
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def create_tool(tool_name: ToolName, config=None) -> "ToolBase":
+    """A new tool, with its default configuration unless config is given."""
+    tool_class = get_tool_class(tool_name)
+    # Not every tool is configurable, Ichimoku takes no config
+    return tool_class() if config is None else tool_class(config)
+
+
+def __getattr__(name: str):
+    # `from toolbox import PotentialRange` keeps working, resolved through the registry
+    if name in TOOL_NAMES_BY_CLASS:
+        return get_tool_class(TOOL_NAMES_BY_CLASS[name])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
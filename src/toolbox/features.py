@@ -0,0 +1,77 @@
+from typing import Callable, Dict, Iterable, List, NamedTuple
+from data_types import Bars, BarSeries
+from toolbox.rolling import cumulative_sum, exponential_mean, rolling_max, rolling_min, rolling_sum, shift, weighted_mean
+import numpy as np
+
+
+class Feature(NamedTuple):
+    # Key of FEATURE_FUNCTIONS
+    function: str
+    # Bar column the feature is computed over
+    column: str
+    period: int = 0
+
+
+class FeatureSet:
+    """
+    Features of one bar series, each computed once on first use. Features
+    may be built from other features (every rolling mean of a column from
+    its cumulative sum), which are computed once as well.
+    """
+
+    def __init__(self, bars: Bars):
+        self.bars = BarSeries.coerce(bars)
+        self.arrays: Dict[Feature, np.ndarray] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, feature: Feature) -> np.ndarray:
+        if feature in self.arrays:
+            self.hits += 1
+            return self.arrays[feature]
+        self.misses += 1
+        array = FEATURE_FUNCTIONS[feature.function](self, feature.column, feature.period)
+        self.arrays[feature] = array
+        return array
+
+    def compute(self, features: Iterable[Feature]):
+        for feature in features:
+            self.get(feature)
+
+    def get_column(self, column: str) -> np.ndarray:
+        return getattr(self.bars, column)
+
+    def get_stats(self):
+        return {'features': len(self.arrays), 'hits': self.hits, 'misses': self.misses}
+
+
+FEATURE_FUNCTIONS: Dict[str, Callable[[FeatureSet, str, int], np.ndarray]] = {
+    'rolling_max': lambda features, column, period: rolling_max(features.get_column(column), period),
+    'rolling_min': lambda features, column, period: rolling_min(features.get_column(column), period),
+    'cumulative_max': lambda features, column, _: np.maximum.accumulate(features.get_column(column)),
+    'cumulative_min': lambda features, column, _: np.minimum.accumulate(features.get_column(column)),
+    'cumulative_sum': lambda features, column, _: cumulative_sum(features.get_column(column)),
+    'rolling_mean': lambda features, column, period: rolling_sum(
+        features.get_column(column), period, features.get(Feature('cumulative_sum', column))) / period,
+    'exponential_mean': lambda features, column, period: exponential_mean(features.get_column(column), period),
+    'weighted_mean': lambda features, column, period: weighted_mean(features.get_column(column), period),
+    'shift': lambda features, column, period: shift(features.get_column(column), period),
+}
+
+
+def compute_feature(bars: BarSeries, feature: Feature) -> np.ndarray:
+    """A single feature, without sharing it."""
+    return FeatureSet(bars).get(feature)
+
+
+def share_features(tools: List, bars: Bars) -> FeatureSet:
+    """
+    Hands the tools one FeatureSet for their next calculate_historical_data
+    over bars, so a feature several of them declare is computed once.
+    Features are computed on first use, tools served from an IndicatorCache
+    never pay for theirs.
+    """
+    features = FeatureSet(bars)
+    for tool in tools:
+        tool.features = features
+    return features
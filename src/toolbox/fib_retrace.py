@@ -1,8 +1,15 @@
 from typing import List, Optional
 from toolbox.tool_base import ToolBase
-import plotly.graph_objects as go
+from toolbox.rolling import RollingExtreme
+from toolbox.features import Feature
 from dataclasses import dataclass, field
-from data_types import BarData
+from data_types import BarSeries
+import numpy as np
+
+# Value of a bar whose close is not within zone of any level
+NO_LEVEL = -1
+# Bars classified per block, bounds the bars x levels temporaries on long series
+CHUNK_SIZE = 65536
 
 
 @dataclass
@@ -12,53 +19,120 @@ class FibonacciRetracementConfig:
                                 0, 23.6, 38.2, 50, 61.8, 78.6, 100])
     # buffer % wise from key level
     zone: float = 2
+    # Swing high and low over the last lookback closes, every close so far if None
+    lookback: Optional[int] = None
 
 
 class FibonacciRetracement(ToolBase):
+    cached_attributes = ('data', 'fib_levels')
+
     def __init__(self, config: Optional[FibonacciRetracementConfig] = None):
+        super().__init__()
         # Default configuration if none is provided
         default_config = FibonacciRetracementConfig()
 
         # Extract configuration values, falling back to defaults where necessary
         config = config or default_config
+        self.config = config
 
         self.levels = config.levels or default_config.levels
         self.levels.sort()
         self.zone = config.zone or default_config.zone
+        self.lookback = config.lookback or default_config.lookback
+        # Prices of the levels at the last bar
         self.fib_levels: List[float] = []
-        self.data: List[bool] = []
+        # Index into levels of the nearest level within zone per bar, NO_LEVEL if none
+        self.data: np.ndarray = np.empty(0, dtype=np.int64)
+        # Rolling state for update
+        self.max_close = -np.inf
+        self.min_close = np.inf
+        self.window_max = RollingExtreme(self.lookback, True) if self.lookback else None
+        self.window_min = RollingExtreme(self.lookback, False) if self.lookback else None
 
-    def get_latest_data(self, bars):
-        return super().get_latest_data(bars)
+    # Levels span the closes in the lookback, each bar only sees the closes up to it
+    def update(self, bar) -> int:
+        close = bar['close']
+        self.bar_count += 1
+        if self.lookback:
+            self.max_close = self.window_max.update(close)
+            self.min_close = self.window_min.update(close)
+            if np.isnan(self.max_close):
+                self.latest = NO_LEVEL
+                return self.latest
+            self.fib_levels = self.__get_fib_levels(self.min_close, self.max_close)
+        elif close > self.max_close or close < self.min_close:
+            self.max_close = max(self.max_close, close)
+            self.min_close = min(self.min_close, close)
+            self.fib_levels = self.__get_fib_levels(
+                self.min_close, self.max_close)
+        self.latest = self.__get_nearest_level(close)
+        return self.latest
 
-    def calculate_historical_data(self, bars):
-        max_close = max(bars, key=lambda bar: bar["close"])["close"]
-        min_close = min(bars, key=lambda bar: bar['close'])["close"]
+    def get_features(self):
+        if self.lookback:
+            return [Feature('rolling_max', 'close', self.lookback), Feature('rolling_min', 'close', self.lookback)]
+        return [Feature('cumulative_max', 'close'), Feature('cumulative_min', 'close')]
+
+    def calculate_historical_data(self, bars) -> np.ndarray:
+        bars = BarSeries.coerce(bars)
+        closes = bars.close
+        max_closes, min_closes = self.__get_swings(bars)
+        self.data = np.full(len(closes), NO_LEVEL, dtype=np.int64)
+        self.fib_levels = []
+        if not len(closes) or np.isnan(max_closes[-1]):
+            return self.data
+        fractions = np.array(self.levels) / 100
+        for start in range(0, len(closes), CHUNK_SIZE):
+            end = start + CHUNK_SIZE
+            # Bars x levels, every bar's distance to every level in one broadcast
+            fib_levels = min_closes[start:end, None] + fractions * \
+                (max_closes[start:end] - min_closes[start:end])[:, None]
+            distances = np.abs(fib_levels - closes[start:end, None]) / fib_levels * 100
+            nearest = np.argmin(np.nan_to_num(distances, nan=np.inf), axis=1)
+            is_within_zone = distances[np.arange(len(nearest)), nearest] <= self.zone
+            self.data[start:end] = np.where(is_within_zone, nearest, NO_LEVEL)
+        self.fib_levels = self.__get_fib_levels(float(min_closes[-1]), float(max_closes[-1]))
+        return self.data
+
+    def __get_swings(self, bars: BarSeries):
+        """Swing high and low per bar, NaN until lookback closes were seen."""
+        return tuple(self.get_feature(bars, feature) for feature in self.get_features())
+
+    def __get_fib_levels(self, min_close: float, max_close: float):
         fib_difference = max_close - min_close
         fib_array = []
         for level in self.levels:
             fib_array.append(min_close + level / 100 * fib_difference)
-        self.fib_levels = fib_array
-        for i in range(0, len(bars)):
-            bar = bars[i]
-            self.data.append(self.__is_within_level(bar))
-        return self.data
+        return fib_array
 
-    def __is_within_level(self, bar: BarData):
-        close = bar["close"]
-        for fib_level in self.fib_levels:
-            return abs(fib_level - close)/fib_level*100 <= self.zone
+    def __get_nearest_level(self, close: float) -> int:
+        nearest = NO_LEVEL
+        nearest_distance = np.inf
+        for index, fib_level in enumerate(self.fib_levels):
+            distance = abs(fib_level - close)/fib_level*100
+            if distance < nearest_distance:
+                nearest, nearest_distance = index, distance
+        return nearest if nearest_distance <= self.zone else NO_LEVEL
 
     def add_to_fig(self, fig, bars, data_type="Historical"):
+        import plotly.graph_objects as go
         if data_type == "Historical":
-            self.calculate_historical_data(bars)
+            self.get_historical_data(bars)
             data = self.fib_levels
         elif data_type == "Latest":
             self.get_latest_data(bars)
             data = self.fib_levels
         else:
             data = data_type
-        timestamps = [bar['timestamp'] for bar in bars]
+        bars = BarSeries.coerce(bars)
+        timestamps = bars.datetimes
+        if self.lookback and data_type in ("Historical", "Latest"):
+            # Levels move with the window, trace them bar by bar
+            max_closes, min_closes = self.__get_swings(bars)
+            for level in self.levels:
+                fig.add_trace(go.Scatter(x=timestamps, y=min_closes + level / 100 * (max_closes - min_closes),
+                                         mode="lines", line=dict(dash="dash", color="gray"), name=f"Fib {level}%"))
+            return
         # Add Fibonacci levels to the figure
         i = 0
         for level in data:
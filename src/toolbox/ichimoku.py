@@ -1,77 +1,101 @@
-from typing import List, Optional, TypedDict
+from typing import Optional, TypedDict
 from toolbox.tool_base import ToolBase
-import plotly.graph_objects as go
+from toolbox.rolling import RollingExtreme, shift
+from toolbox.features import Feature
+from collections import deque
+import numpy as np
+from data_types import BarSeries
 
 
+# Column arrays aligned with the bars, NaN where a line is not defined yet
 class IchimokuData(TypedDict):
-    tenkan_sen: Optional[float]
-    kijun_sen: Optional[float]
-    senkou_span_a: Optional[float]
-    senkou_span_b: Optional[float]
-    chikou_span: Optional[float]
+    tenkan_sen: np.ndarray
+    kijun_sen: np.ndarray
+    senkou_span_a: np.ndarray
+    senkou_span_b: np.ndarray
+    chikou_span: np.ndarray
 
 
-class Ichimoku(ToolBase):
-    def __init__(self):
-        self.data: List[IchimokuData] = []
-
-    def get_latest_data(self, bars):
-        return super().get_latest_data(bars)
-
-    def calculate_historical_data(self, bars) -> List[IchimokuData]:
-        def calculate_high_low_average(data, period):
-            if len(data) < period:
-                return None
-            highest_high = max(bar['high'] for bar in data[-period:])
-            lowest_low = min(bar['low'] for bar in data[-period:])
-            return (highest_high + lowest_low) / 2
+# Values of the latest bar, as returned by update
+class IchimokuValue(TypedDict):
+    tenkan_sen: float
+    kijun_sen: float
+    senkou_span_a: float
+    senkou_span_b: float
+    chikou_span: float
 
-        ichimoku_data = []
-
-        for i in range(len(bars)):
-            # Calculate Tenkan-sen (9-period)
-            tenkan_sen = calculate_high_low_average(bars[:i + 1], 9)
-
-            # Calculate Kijun-sen (26-period)
-            kijun_sen = calculate_high_low_average(bars[:i + 1], 26)
 
+class Ichimoku(ToolBase):
+    def __init__(self):
+        super().__init__()
+        self.data: Optional[IchimokuData] = None
+        # Rolling state for update
+        self.highest_highs = {period: RollingExtreme(period, is_max=True)
+                              for period in (9, 26, 52)}
+        self.lowest_lows = {period: RollingExtreme(period, is_max=False)
+                            for period in (9, 26, 52)}
+        self.closes = deque(maxlen=27)
+
+    def update(self, bar) -> IchimokuValue:
+        self.bar_count += 1
+        high_low_averages = {}
+        for period in (9, 26, 52):
+            high_low_averages[period] = (self.highest_highs[period].update(
+                bar['high']) + self.lowest_lows[period].update(bar['low'])) / 2
+        self.closes.append(bar['close'])
+        self.latest = {
+            "tenkan_sen": high_low_averages[9],
+            "kijun_sen": high_low_averages[26],
+            "senkou_span_a": (high_low_averages[9] + high_low_averages[26]) / 2,
+            "senkou_span_b": high_low_averages[52],
+            "chikou_span": self.closes[0] if len(self.closes) == 27 else np.nan,
+        }
+        return self.latest
+
+    def get_features(self):
+        return [feature for period in (9, 26, 52) for feature in (
+            Feature('rolling_max', 'high', period), Feature('rolling_min', 'low', period))] + \
+            [Feature('shift', 'close', 26)]
+
+    def calculate_historical_data(self, bars) -> IchimokuData:
+        bars = BarSeries.coerce(bars)
+
+        def calculate_high_low_average(period):
+            return (self.get_feature(bars, Feature('rolling_max', 'high', period)) +
+                    self.get_feature(bars, Feature('rolling_min', 'low', period))) / 2
+
+        # Calculate Tenkan-sen (9-period)
+        tenkan_sen = calculate_high_low_average(9)
+        # Calculate Kijun-sen (26-period)
+        kijun_sen = calculate_high_low_average(26)
+        self.data = {
+            "tenkan_sen": tenkan_sen,
+            "kijun_sen": kijun_sen,
             # Calculate Senkou Span A (26-period projection)
-            if tenkan_sen is not None and kijun_sen is not None:
-                senkou_span_a = (tenkan_sen + kijun_sen) / 2
-            else:
-                senkou_span_a = None
-
+            "senkou_span_a": (tenkan_sen + kijun_sen) / 2,
             # Calculate Senkou Span B (52-period projection)
-            senkou_span_b = calculate_high_low_average(bars[:i + 1], 52)
-
+            "senkou_span_b": calculate_high_low_average(52),
             # Calculate Chikou Span (26-period lagging)
-            chikou_span = bars[i - 26]['close'] if i >= 26 else None
-
-            ichimoku_data.append({
-                "tenkan_sen": tenkan_sen,
-                "kijun_sen": kijun_sen,
-                "senkou_span_a": senkou_span_a,
-                "senkou_span_b": senkou_span_b,
-                "chikou_span": chikou_span,
-            })
-        self.data = ichimoku_data
+            "chikou_span": self.get_feature(bars, Feature('shift', 'close', 26)),
+        }
         return self.data
 
     def add_to_fig(self, fig, bars, data_type="Historical"):
+        import plotly.graph_objects as go
         # Get the pre-calculated data
         if data_type == "Historical":
-            ichimoku_data = self.calculate_historical_data(bars)
+            ichimoku_data = self.get_historical_data(bars)
         elif data_type == "Latest":
             ichimoku_data = self.get_latest_data(bars)
         else:
             ichimoku_data = data_type  # Assume data is already pre-calculated
             # Add Tenkan-sen (Conversion Line)
-        timestamps = [bar['timestamp'] for bar in bars]
-        tenkan_sen = [data['tenkan_sen'] for data in ichimoku_data]
-        kijun_sen = [data['kijun_sen'] for data in ichimoku_data]
-        senkou_span_a = [data['senkou_span_a'] for data in ichimoku_data]
-        senkou_span_b = [data['senkou_span_b'] for data in ichimoku_data]
-        chikou_span = [data['chikou_span'] for data in ichimoku_data]
+        timestamps = BarSeries.coerce(bars).datetimes
+        tenkan_sen = ichimoku_data['tenkan_sen']
+        kijun_sen = ichimoku_data['kijun_sen']
+        senkou_span_a = ichimoku_data['senkou_span_a']
+        senkou_span_b = ichimoku_data['senkou_span_b']
+        chikou_span = ichimoku_data['chikou_span']
         fig.add_trace(go.Scatter(
             x=timestamps,
             y=tenkan_sen,
@@ -88,10 +112,11 @@ class Ichimoku(ToolBase):
             line=dict(color='red', width=2)
         ))
 
-        # Add Senkou Span A (Leading Span A)
-        future_timestamps = timestamps[26:] + [None] * 26
+        # Add Senkou Span A (Leading Span A), projected 26 bars forward
+        senkou_span_a = shift(senkou_span_a, 26)
+        senkou_span_b = shift(senkou_span_b, 26)
         fig.add_trace(go.Scatter(
-            x=future_timestamps,
+            x=timestamps,
             y=senkou_span_a,
             mode='lines',
             name='Senkou Span A',
@@ -100,7 +125,7 @@ class Ichimoku(ToolBase):
 
         # Add Senkou Span B (Leading Span B)
         fig.add_trace(go.Scatter(
-            x=future_timestamps,
+            x=timestamps,
             y=senkou_span_b,
             mode='lines',
             name='Senkou Span B',
@@ -109,8 +134,8 @@ class Ichimoku(ToolBase):
 
         # Add Cloud (Fill between Senkou Span A and B)
         fig.add_trace(go.Scatter(
-            x=future_timestamps + future_timestamps[::-1],
-            y=senkou_span_a + senkou_span_b[::-1],
+            x=np.concatenate((timestamps, timestamps[::-1])),
+            y=np.concatenate((senkou_span_a, senkou_span_b[::-1])),
             fill='toself',
             # Semi-transparent fill for cloud
             fillcolor='rgba(128, 128, 255, 0.2)',
@@ -119,10 +144,9 @@ class Ichimoku(ToolBase):
         ))
 
         # Add Chikou Span (Lagging Span)
-        chikou_timestamps = [None] * 26 + timestamps[:-26]
         fig.add_trace(go.Scatter(
-            x=chikou_timestamps,
-            y=chikou_span,
+            x=timestamps,
+            y=shift(chikou_span, -26),
             mode='lines',
             name='Chikou Span',
             line=dict(color='purple', width=1, dash='dot')
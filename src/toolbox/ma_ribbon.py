@@ -1,58 +1,104 @@
-from typing import List, Tuple, Optional
+from typing import List, Literal, Tuple, Optional
 from toolbox.tool_base import ToolBase
-import plotly.graph_objects as go
+from toolbox.features import Feature
+import numpy as np
 from dataclasses import dataclass, field
-from typing import Optional
+from collections import deque
+from data_types import BarSeries
+
+MAType = Literal["SMA", "EMA", "WMA"]
 
 
 @dataclass
 class MARibbonConfig:
     periods: List[int] = field(default_factory=lambda: [5, 20, 40, 50, 100, 200])
+    # SMA, EMA or WMA
+    ma_type: MAType = "SMA"
 
 
 class MARibbon(ToolBase):
     def __init__(self, config: Optional[MARibbonConfig] = None):
+        super().__init__()
         # Default configuration if none is provided
         default_config = MARibbonConfig()
 
         # Extract configuration values, falling back to defaults where necessary
         config = config or default_config
+        self.config = config
 
         self.periods = config.periods or default_config.periods
         self.periods.sort()
-        self.data: Tuple[List[List[Optional[float]]], List[int]] = []
+        self.ma_type = config.ma_type or default_config.ma_type
+        self.data: Tuple[np.ndarray, List[int]] = []
+        # Rolling state for update
+        self.windows = [deque() for _ in self.periods]
+        self.sums = [0.0] * len(self.periods)
+        self.weighted_sums = [0.0] * len(self.periods)
+        self.emas = [np.nan] * len(self.periods)
 
-    def get_latest_data(self, bars):
-        return super().get_latest_data(bars)
+    # Returns the latest value of every period, NaN during warm-up
+    def update(self, bar) -> np.ndarray:
+        close = bar['close']
+        self.bar_count += 1
+        latest = np.full(len(self.periods), np.nan)
+        for period_idx, period in enumerate(self.periods):
+            window = self.windows[period_idx]
+            window.append(close)
+            # Every weight drops by one, the new close weighs period
+            self.weighted_sums[period_idx] += period * \
+                close - self.sums[period_idx]
+            self.sums[period_idx] += close
+            if len(window) > period:
+                self.sums[period_idx] -= window.popleft()
+            if self.bar_count < period:
+                continue
+            if self.ma_type == "SMA":
+                latest[period_idx] = self.sums[period_idx] / period
+            elif self.ma_type == "EMA":
+                ema = self.emas[period_idx]
+                ema = self.sums[period_idx] / period if np.isnan(ema) else \
+                    ema + 2 / (period + 1) * (close - ema)
+                self.emas[period_idx] = latest[period_idx] = ema
+            elif self.ma_type == "WMA":
+                latest[period_idx] = self.weighted_sums[period_idx] / \
+                    (period * (period + 1) / 2)
+            else:
+                raise ValueError(f"Invalid MA type: {self.ma_type}")
+        self.latest = latest
+        return self.latest
 
-    # Define the function to calculate moving averages
-    def calculate_historical_data(self, bars) -> Tuple[List[List[Optional[float]]], List[int]]:
-        ma_data: List[List[Optional[float]]] = [[]
-                                                # Initialize a list for each MA period
-                                                for _ in self.periods]
+    def get_features(self):
+        return [Feature(self.__get_moving_average(), 'close', period) for period in self.periods]
 
-        # Iterate over each MA period
-        for period_idx, period in enumerate(self.periods):
-            for i in range(len(bars)):
-                if i + 1 < period:  # Not enough data for this period
-                    ma_data[period_idx].append(None)
-                else:
-                    # Calculate the average close price over the period
-                    window = bars[i + 1 - period:i + 1]
-                    average = sum(bar['close'] for bar in window) / period
-                    ma_data[period_idx].append(average)
+    # Rows are periods, columns are bars. The warm-up region of each row is NaN
+    def calculate_historical_data(self, bars) -> Tuple[np.ndarray, List[int]]:
+        bars = BarSeries.coerce(bars)
+        ma_data = np.empty((len(self.periods), len(bars)))
+        for period_idx, feature in enumerate(self.get_features()):
+            ma_data[period_idx] = self.get_feature(bars, feature)
         self.data = ma_data, self.periods
         return self.data
 
+    def __get_moving_average(self) -> str:
+        if self.ma_type == "SMA":
+            return 'rolling_mean'
+        elif self.ma_type == "EMA":
+            return 'exponential_mean'
+        elif self.ma_type == "WMA":
+            return 'weighted_mean'
+        else:
+            raise ValueError(f"Invalid MA type: {self.ma_type}")
+
     def add_to_fig(self, fig, bars, data_type="Historical"):
+        import plotly.graph_objects as go
         if data_type == "Historical":
-            ma_data, self.periods = self.calculate_historical_data(bars)
+            ma_data, self.periods = self.get_historical_data(bars)
         elif data_type == "Latest":
             ma_data = self.get_latest_data(bars)
         else:
             ma_data = data_type
 
-        timestamps = [bar['timestamp'] for bar in bars]
+        timestamps = BarSeries.coerce(bars).datetimes
 
         # Plot the MA ribbons
         for idx, ma in enumerate(ma_data):
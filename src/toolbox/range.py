@@ -1,10 +1,19 @@
-from data_types import BarData
-from typing import Literal, List, TypedDict
+from data_types import BarSeries
+from typing import Callable, Dict, Literal, List, Sequence, Tuple, TypedDict
 from toolbox.tool_base import ToolBase
+from toolbox.features import Feature
 from dataclasses import dataclass
+import bisect
+import heapq
+import math
+import numpy as np
 from typing import Optional
 
 LevelType = Literal["Resistance", "Support"]
+# Price of the point swing detection starts from, beaten by any close
+RESET_PRICES = {'Resistance': 0, 'Support': math.inf}
+# Orders support ranges after resistance ranges when looking up the range a close is in
+SUPPORT_PRIORITY = 1 << 32
 ExitType = Literal["Breach", "Bounce"]
 
 
@@ -41,13 +50,232 @@ class RangeConfig:
     max_zone_size: float = 15
 
 
+class SwingTracker:
+    """
+    Finds swing highs (Resistance) or lows (Support) one close at a time: a
+    point is confirmed once lookback_period bars pass without a more extreme
+    close, and consecutive confirmed points may form a potential range.
+    """
+
+    def __init__(self, levelType: LevelType, lookback_period: int, is_potential_range: Callable[[ExtremePoint, ExtremePoint], bool]):
+        self.reset_point: ExtremePoint = {'index': 0, 'price': RESET_PRICES[levelType]}
+        self.is_more_extreme = (lambda x, y: x > y) if levelType == 'Resistance' else (
+            lambda x, y: x < y)
+        self.lookback_period = lookback_period
+        self.is_potential_range = is_potential_range
+        self.right_offset = 0
+        self.point_prev = self.reset_point
+        self.point = self.reset_point
+
+    def update(self, i: int, close: float) -> Optional[PotentialRange]:
+        is_more_extreme = self.is_more_extreme
+        point = self.point
+        point_prev = self.point_prev
+        potential_range = None
+        if is_more_extreme(close, point['price']):
+            point = {
+                'index': i,
+                'price': close,
+            }
+            self.right_offset = 0
+        else:
+            self.right_offset += 1
+        if self.right_offset == self.lookback_period:
+            if self.is_potential_range(point, point_prev):
+                potential_range = {
+                    'breach_price': point['price'] if is_more_extreme(point['price'], point_prev['price']) else point_prev['price'],
+                    'entry_price': point['price'] if not is_more_extreme(point['price'], point_prev['price']) else point_prev['price'],
+                    'starting_index': point['index'] if point['index'] < point_prev['index'] else point_prev['index'],
+                    'ending_index': point['index'] if point['index'] > point_prev['index'] else point_prev['index'],
+                    'validated_index': 0
+                }
+            self.right_offset = 0
+            self.point_prev = point
+            point = self.reset_point
+        self.point = point
+        return potential_range
+
+
+def find_swing_points(closes: np.ndarray, lookback_period: int, forward_max: np.ndarray, forward_min: np.ndarray) -> Dict[LevelType, np.ndarray]:
+    """
+    Indices of the points SwingTracker confirms, for both level types at
+    once. forward_max[i] and forward_min[i] are the max and min of the
+    lookback_period closes after close i, the closes' rolling_max and
+    rolling_min from lookback_period bars later.
+
+    A confirmed point is the first close at or after the tracker's start
+    that no later close beats within lookback_period bars. Such a close
+    always is the tracker's running extreme too, so only the next
+    qualifying close after every restart has to be looked up, once per
+    swing instead of once per bar.
+    """
+    count = max(len(closes) - lookback_period, 0)
+    closes = closes[:count]
+    swing_points = {}
+    for level_type, is_confirmed in (('Resistance', closes >= forward_max[:count]),
+                                     ('Support', closes <= forward_min[:count])):
+        # Index of the first confirmed close at or after every index, count if none
+        next_confirmed = np.minimum.accumulate(
+            np.where(is_confirmed, np.arange(count), count)[::-1])[::-1].tolist()
+        points = []
+        start = lookback_period
+        while start < count and next_confirmed[start] < count:
+            points.append(next_confirmed[start])
+            # The tracker restarts on the bar after the confirmation
+            start = points[-1] + lookback_period + 1
+        swing_points[level_type] = np.array(points, dtype=np.int64)
+    return swing_points
+
+
+class TouchIndex:
+    """
+    Potential ranges waiting for a valid touch. A candidate waits in a heap
+    until its activation bar (ending_index + lookback_period + 1), then moves
+    into a list sorted by entry price, so each bar only visits the candidates
+    whose entry price lies between its close and its high (or low).
+    """
+
+    def __init__(self, levelType: LevelType, lookback_period: int):
+        self.levelType = levelType
+        self.lookback_period = lookback_period
+        self.waiting: List[Tuple[int, int, PotentialRange]] = []
+        self.entry_prices: List[float] = []
+        # (insertion order, potential range), parallel to entry_prices
+        self.active: List[Tuple[int, PotentialRange]] = []
+        self.count = 0
+
+    def __len__(self):
+        return len(self.waiting) + len(self.active)
+
+    def add(self, potential_range: PotentialRange):
+        activation_index = potential_range['ending_index'] + \
+            self.lookback_period + 1
+        heapq.heappush(self.waiting, (activation_index,
+                       self.count, potential_range))
+        self.count += 1
+
+    # extreme is the bar's high for Resistance, its low for Support
+    def pop_touched(self, i: int, extreme: float, close: float) -> List[PotentialRange]:
+        """Removes and returns, in insertion order, the active candidates touched by bar i."""
+        while self.waiting and self.waiting[0][0] <= i:
+            _, order, potential_range = heapq.heappop(self.waiting)
+            position = bisect.bisect_right(
+                self.entry_prices, potential_range['entry_price'])
+            self.entry_prices.insert(
+                position, potential_range['entry_price'])
+            self.active.insert(position, (order, potential_range))
+        if self.levelType == 'Resistance':
+            # Wick above the entry price, close at or below it
+            start = bisect.bisect_left(self.entry_prices, close)
+            end = bisect.bisect_left(self.entry_prices, extreme)
+        else:
+            # Wick below the entry price, close at or above it
+            start = bisect.bisect_right(self.entry_prices, extreme)
+            end = bisect.bisect_right(self.entry_prices, close)
+        if start >= end:
+            return []
+        touched = self.active[start:end]
+        del self.entry_prices[start:end]
+        del self.active[start:end]
+        return [potential_range for _, potential_range in sorted(touched, key=lambda item: item[0])]
+
+
+class SegmentTree:
+    """
+    Lowest priority among open intervals (low, high) strictly containing a
+    price, over endpoint coordinates fixed upfront. insert and find are O(log n).
+    """
+
+    def __init__(self, coordinates: Sequence[float] = ()):
+        self.coordinates = sorted(set(coordinates))
+        self.size = 1
+        while self.size < 2 * len(self.coordinates) + 1:
+            self.size *= 2
+        self.tree = [math.inf] * (2 * self.size)
+
+    def is_known(self, price: float):
+        return self.__get_slot(price) % 2 == 1
+
+    def insert(self, low: float, high: float, priority: int):
+        # The open interval covers every slot strictly between its endpoint slots
+        left = self.size + self.__get_slot(low) + 1
+        right = self.size + self.__get_slot(high) - 1
+        while left <= right:
+            if left % 2 == 1:
+                self.tree[left] = min(self.tree[left], priority)
+                left += 1
+            if right % 2 == 0:
+                self.tree[right] = min(self.tree[right], priority)
+                right -= 1
+            left //= 2
+            right //= 2
+
+    def find(self, price: float):
+        position = self.size + self.__get_slot(price)
+        best = math.inf
+        while position:
+            best = min(best, self.tree[position])
+            position //= 2
+        return best
+
+    # Slot 2k + 1 is the point coordinates[k], slot 2k is the gap just below it
+    def __get_slot(self, price: float):
+        k = bisect.bisect_left(self.coordinates, price)
+        is_point = k < len(self.coordinates) and self.coordinates[k] == price
+        return 2 * k + 1 if is_point else 2 * k
+
+
+class IntervalIndex:
+    """
+    Open price intervals (low, high), each with a priority. find(price) returns
+    the item of highest priority (lowest number) among the intervals strictly
+    containing price. Intervals whose endpoints were passed upfront go into one
+    SegmentTree, O(log n) per add and find. The others, e.g. every range
+    validated by update, are kept in trees of 1, 2, 4... intervals, an add
+    merging equal sized trees into one, so an add is O(log² n) amortized and
+    a find O(log² n) instead of rebuilding every interval after each add.
+    """
+
+    def __init__(self, coordinates: Sequence[float] = ()):
+        self.tree = SegmentTree(coordinates)
+        # (tree, its intervals), from the largest to the smallest
+        self.batches: List[Tuple[SegmentTree, List[Tuple[float, float, int]]]] = []
+        self.items = {}
+
+    def __len__(self):
+        return len(self.items)
+
+    def add(self, low: float, high: float, priority: int, item):
+        self.items[priority] = item
+        if self.tree.is_known(low) and self.tree.is_known(high):
+            self.tree.insert(low, high, priority)
+            return
+        intervals = [(low, high, priority)]
+        while self.batches and len(self.batches[-1][1]) == len(intervals):
+            intervals += self.batches.pop()[1]
+        batch = SegmentTree([price for interval in intervals for price in interval[:2]])
+        for interval in intervals:
+            batch.insert(*interval)
+        self.batches.append((batch, intervals))
+
+    def find(self, price: float):
+        best = self.tree.find(price)
+        for batch, _ in self.batches:
+            best = min(best, batch.find(price))
+        return self.items.get(best)
+
+
 class PotentialRange(ToolBase):
+    cached_attributes = ('data', 'ranges')
+
     def __init__(self, config: Optional[RangeConfig] = None):
+        super().__init__()
         # Default configuration if none is provided
         default_config = RangeConfig()
 
         # Extract configuration values, falling back to defaults where necessary
         config = config or default_config
+        self.config = config
 
         self.lookback_period = config.lookback_period or default_config.lookback_period
         self.min_points_distance = config.min_points_distance or default_config.min_points_distance
@@ -61,44 +289,76 @@ class PotentialRange(ToolBase):
         self.max_zone_size = config.max_zone_size or default_config.max_zone_size
         self.max_zone_size = max(self.max_zone_size, self.min_zone_size)
         self.current_range: Range = None
-        self.current_range_index = -1
         self.ranges: List[Range] = []
         self.data: List[LevelType] = []
+        # Rolling state for update
+        self.swing_trackers = {level_type: SwingTracker(level_type, self.lookback_period, self.__is__potential_range)
+                               for level_type in ('Resistance', 'Support')}
+        self.pending_ranges = {level_type: TouchIndex(level_type, self.lookback_period)
+                               for level_type in ('Resistance', 'Support')}
+        self.resistance_range_count = 0
+        self.range_index = IntervalIndex()
 
-    def get_latest_data(self, bars):
-        return super().get_latest_data(bars)
+    def update(self, bar) -> Optional[LevelType]:
+        index = self.bar_count
+        self.bar_count += 1
+        close = bar['close']
+        if index >= self.lookback_period:
+            for level_type, extreme in (('Resistance', bar['high']), ('Support', bar['low'])):
+                potential_range = self.swing_trackers[level_type].update(
+                    index, close)
+                if potential_range:
+                    self.pending_ranges[level_type].add(potential_range)
+                for range_item in self.__validate_touches(index, extreme, close, self.pending_ranges[level_type], level_type):
+                    # Keep self.ranges ordered like calculate_historical_data does, resistance ranges first
+                    if level_type == 'Resistance':
+                        self.ranges.insert(
+                            self.resistance_range_count, range_item)
+                        self.resistance_range_count += 1
+                        priority = self.resistance_range_count
+                    else:
+                        self.ranges.append(range_item)
+                        priority = SUPPORT_PRIORITY + len(self.ranges)
+                    self.range_index.add(
+                        range_item['price_low'], range_item['price_high'], priority, range_item)
+        self.latest = self.__get_bar_status(close, index)
+        return self.latest
 
     def calculate_historical_data(self, bars):
-        potential_resistance_ranges = self.__find_potential_ranges(
-            bars, 'Resistance')
-        potential_support_ranges = self.__find_potential_ranges(
-            bars, 'Support')
+        bars = BarSeries.coerce(bars)
+        self.current_range = None
+        potential_ranges = self.__find_potential_ranges(bars)
         resistance_ranges = self.__get_valid_ranges(
-            bars, potential_resistance_ranges, 'Resistance')
+            bars, potential_ranges['Resistance'], 'Resistance')
         support_ranges = self.__get_valid_ranges(
-            bars, potential_support_ranges, 'Support')
+            bars, potential_ranges['Support'], 'Support')
         self.ranges = resistance_ranges + support_ranges
         self.data = self.__get_bars_status(bars)
         return self.data
 
+    def get_features(self):
+        return [Feature('rolling_max', 'close', self.lookback_period),
+                Feature('rolling_min', 'close', self.lookback_period)]
+
     def add_to_fig(self, fig, bars, data_type="Historical"):
         if data_type == "Historical":
-            self.calculate_historical_data(bars)
+            self.get_historical_data(bars)
             data = self.ranges
         elif data_type == "Latest":
             self.get_latest_data(bars)
             data = self.ranges
         elif data_type:
             data = data_type
-        timestamps = [bar['timestamp'] for bar in bars]
+        timestamps = BarSeries.coerce(bars).datetimes
         # Add the base rectangle shape
+        shapes = []
         for range_item in data:
             price_high = range_item['price_high']
             price_low = range_item['price_low']
             starting_index = range_item['starting_index']
             # Determine rectangle color based on breach/entry price comparison
             color = 'rgba(255, 255, 0, 0.2)'
-            fig.add_shape(
+            shapes.append(dict(
                 type="rect",
                 name=f"Potential {type} Range",
                 x0=timestamps[starting_index],  # Start time (adjust as needed)
@@ -107,42 +367,42 @@ class PotentialRange(ToolBase):
                 y1=price_high,  # Upper bound of the range
                 fillcolor=color,
                 line={"width": 0},  # No border
-            )
+            ))
+        # add_shape revalidates every shape on the figure, add them all at once instead
+        fig.layout.shapes += tuple(shapes)
 
     def get_nr_of_subplots(self):
         return 0
 
-    def __find_potential_ranges(self, bars: List[BarData], levelType: LevelType):
-        reset_value = 0 if levelType == 'Resistance' else 100000000
-        reset_point: ExtremePoint = {'index': 0, 'price': reset_value}
-        is_more_extreme = (lambda x, y: x > y) if levelType == 'Resistance' else (
-            lambda x, y: x < y)
-        right_offset = 0
-        point_prev = reset_point
-        point = reset_point
-        potential_ranges: List[PotentialRange] = []
-        for i in range(self.lookback_period, len(bars) - self.lookback_period):
-            close = bars[i]['close']
-            if is_more_extreme(close, point['price']):
-                point = {
-                    'index': i,
-                    'price': close,
-                }
-                right_offset = 0
-            else:
-                right_offset += 1
-            if right_offset == self.lookback_period:
-                if self.__is__potential_range(point, point_prev):
-                    potential_ranges.append({
-                        'breach_price': point['price'] if is_more_extreme(point['price'], point_prev['price']) else point_prev['price'],
-                        'entry_price': point['price'] if not is_more_extreme(point['price'], point_prev['price']) else point_prev['price'],
-                        'starting_index': point['index'] if point['index'] < point_prev['index'] else point_prev['index'],
-                        'ending_index': point['index'] if point['index'] > point_prev['index'] else point_prev['index'],
-                        'validated_index': 0
-                    })
-                right_offset = 0
-                point_prev = point
-                point = reset_point
+    def __find_potential_ranges(self, bars: BarSeries) -> Dict[LevelType, List[PotentialRange]]:
+        closes = bars.close
+        # The max and min of the lookback_period closes after every close
+        forward_max, forward_min = (self.get_feature(bars, feature)[self.lookback_period:]
+                                    for feature in self.get_features())
+        swing_points = find_swing_points(closes, self.lookback_period, forward_max, forward_min)
+        potential_ranges = {}
+        for level_type, points in swing_points.items():
+            # Every point paired with the one before it, the first with the reset point
+            indices = points
+            indices_prev = np.concatenate(([0], points))[:-1]
+            prices = closes[indices]
+            prices_prev = np.concatenate(([RESET_PRICES[level_type]], prices))[:-1]
+            points_distances = indices - indices_prev
+            points_differences = np.abs((prices - prices_prev) / prices * 100)
+            is_potential_range = (indices_prev != 0) & (points_distances >= self.min_points_distance) & (points_distances <= self.max_points_distance) & \
+                (points_differences >= self.min_zone_size) & (points_differences <= self.max_zone_size)
+            is_more_extreme = prices > prices_prev if level_type == 'Resistance' else prices < prices_prev
+            breach_prices = np.where(is_more_extreme, prices, prices_prev)
+            entry_prices = np.where(is_more_extreme, prices_prev, prices)
+            potential_ranges[level_type] = [{
+                'breach_price': breach_price,
+                'entry_price': entry_price,
+                'starting_index': starting_index,
+                'ending_index': ending_index,
+                'validated_index': 0
+            } for breach_price, entry_price, starting_index, ending_index in zip(
+                breach_prices[is_potential_range].tolist(), entry_prices[is_potential_range].tolist(),
+                indices_prev[is_potential_range].tolist(), indices[is_potential_range].tolist())]
         return potential_ranges
 
     def __is__potential_range(self, point: ExtremePoint, point_prev: ExtremePoint):
@@ -151,53 +411,65 @@ class PotentialRange(ToolBase):
             (point['price'] - point_prev['price']) / point['price'] * 100)
         return point_prev['index'] != 0 and points_distance >= self.min_points_distance and points_distance <= self.max_points_distance and points_difference >= self.min_zone_size and points_difference <= self.max_zone_size
 
-    def __get_valid_ranges(self, bars: List[BarData], potential_ranges: List[PotentialRange], levelType: LevelType):
+    def __get_valid_ranges(self, bars: BarSeries, potential_ranges: List[PotentialRange], levelType: LevelType):
         valid_ranges: List[Range] = []
+        touch_index = TouchIndex(levelType, self.lookback_period)
+        for potential_range in potential_ranges:
+            touch_index.add(potential_range)
+        extremes = (bars.high if levelType == 'Resistance' else bars.low).tolist()
+        closes = bars.close.tolist()
         for i in range(self.lookback_period, len(bars)):
-            bar = bars[i]
-            j = 0
-            while j < len(potential_ranges):
-                potential_range = potential_ranges[j]
-                if i > potential_range['ending_index'] + self.lookback_period and self.__is_valid_touch(bar, potential_range, levelType):
-                    potential_ranges.pop(j)
-                    breach_price = potential_range['breach_price']
-                    entry_price = potential_range['entry_price']
-                    valid_ranges.append({
-                        'price_low': entry_price if levelType == 'Resistance' else breach_price,
-                        'price_high':  breach_price if levelType == 'Resistance' else entry_price,
-                        'starting_index': i,
-                        'type': levelType
-                    })
-                    valid_ranges[-1]['validated_index'] = i
-                else:
-                    j += 1
+            if not touch_index:
+                break
+            valid_ranges += self.__validate_touches(
+                i, extremes[i], closes[i], touch_index, levelType)
         return valid_ranges
 
-    def __is_valid_touch(self, bar: BarData, potential_range: PotentialRange, levelType):
-        is_past_entry = (lambda x, y: x > y) if levelType == 'Resistance' else (
-            lambda x, y: x < y)
-        extreme_type = 'high' if levelType == 'Resistance' else 'low'
-        return is_past_entry(bar[extreme_type], potential_range['entry_price']) and not is_past_entry(bar['close'], potential_range['entry_price'])
+    # Removes the potential ranges touched by bar i and returns them as valid ranges
+    def __validate_touches(self, i: int, extreme: float, close: float, touch_index: TouchIndex, levelType: LevelType):
+        valid_ranges: List[Range] = []
+        for potential_range in touch_index.pop_touched(i, extreme, close):
+            breach_price = potential_range['breach_price']
+            entry_price = potential_range['entry_price']
+            valid_ranges.append({
+                'price_low': entry_price if levelType == 'Resistance' else breach_price,
+                'price_high':  breach_price if levelType == 'Resistance' else entry_price,
+                'starting_index': i,
+                'type': levelType
+            })
+            valid_ranges[-1]['validated_index'] = i
+        return valid_ranges
 
     def __flip_range(self, range: Range):
         type = range['type']
         range['type'] = 'Resistance' if type == 'Support' else 'Support'
 
-    def __get_bars_status(self, bars: List[BarData]):
+    def __get_bars_status(self, bars: BarSeries):
         # Set the bar status to none untill first confirmed range
-        starting_point = 9999999
+        starting_point = len(bars)
         data: List[LevelType] = []
         for range_item in self.ranges:
             starting_point = min(starting_point, range_item['starting_index'])
         for i in range(0, starting_point):
             data.append(None)
+        # Ranges enter the index once their starting bar is reached, earlier ones in self.ranges win ties
+        self.range_index = IntervalIndex(
+            [price for range_item in self.ranges for price in (range_item['price_low'], range_item['price_high'])])
+        pending = sorted(range(len(self.ranges)),
+                         key=lambda j: self.ranges[j]['starting_index'])
+        pending_index = 0
         # Then see if a bar is within a range or exiting one
+        closes = bars.close.tolist()
         for i in range(starting_point, len(bars)):
-            data.append(self.__get_bar_status(bars[i], i))
+            while pending_index < len(pending) and self.ranges[pending[pending_index]]['starting_index'] <= i:
+                range_item = self.ranges[pending[pending_index]]
+                self.range_index.add(
+                    range_item['price_low'], range_item['price_high'], pending[pending_index], range_item)
+                pending_index += 1
+            data.append(self.__get_bar_status(closes[i], i))
         return data
 
-    def __get_bar_status(self, bar: BarData, index: int):
-        close: float = bar['close']
+    def __get_bar_status(self, close: float, index: int):
         if self.current_range:
             level_type = self.current_range['type']
             high = self.current_range['price_high']
@@ -207,20 +479,17 @@ class PotentialRange(ToolBase):
             is_bounce = (lambda close, high, low: close < low) if level_type == 'Resistance' else (
                 lambda close, high, low: close > high)
             if is_breach(close, high, low):
-                self.__flip_range(self.ranges[self.current_range_index])
+                self.__flip_range(self.current_range)
                 self.current_range = None
-                self.current_range_index = -1
                 return None
             elif is_bounce(close, high, low):
                 self.current_range = None
-                self.current_range_index = -1
                 return None
             else:
                 return self.current_range['type']
         else:
-            for j in range(len(self.ranges)):
-                range_item = self.ranges[j]
-                if close > range_item['price_low'] and close < range_item['price_high'] and index >= range_item['starting_index']:
-                    self.current_range = range_item
-                    self.current_range_index = j
-                    return self.current_range['type']
+            # Flipping a range's type doesn't move it, so the index never needs updating
+            range_item = self.range_index.find(close)
+            if range_item:
+                self.current_range = range_item
+                return self.current_range['type']
@@ -0,0 +1,123 @@
+from typing import Optional, Sequence
+from collections import deque
+import numpy as np
+import pandas as pd
+
+
+def as_array(values: Sequence[float]) -> np.ndarray:
+    return np.asarray(values, dtype=np.float64)
+
+
+def cumulative_sum(values: Sequence[float]) -> np.ndarray:
+    """Cumulative sum offset by the first value, so it stays small on long series."""
+    values = as_array(values)
+    if not len(values):
+        return values.copy()
+    return np.cumsum(values - values[0])
+
+
+def rolling_sum(values: Sequence[float], period: int, cumsum: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Sum of the last `period` values at every index, NaN during warm-up.
+    Pass cumulative_sum(values) to share it between periods.
+    """
+    values = as_array(values)
+    result = np.full(len(values), np.nan)
+    if period <= 0 or len(values) < period:
+        return result
+    if cumsum is None:
+        cumsum = cumulative_sum(values)
+    sums = cumsum[period - 1:].copy()
+    sums[1:] -= cumsum[:-period]
+    result[period - 1:] = sums + values[0] * period
+    return result
+
+
+def rolling_mean(values: Sequence[float], period: int) -> np.ndarray:
+    return rolling_sum(values, period) / period
+
+
+def weighted_mean(values: Sequence[float], period: int) -> np.ndarray:
+    """Linearly weighted mean, the most recent value weighing `period`."""
+    values = as_array(values)
+    result = np.full(len(values), np.nan)
+    if period <= 0 or len(values) < period:
+        return result
+    weights = np.arange(period, 0, -1, dtype=np.float64)
+    result[period - 1:] = np.convolve(values, weights, mode='valid') / weights.sum()
+    return result
+
+
+def exponential_mean(values: Sequence[float], period: int) -> np.ndarray:
+    """EMA with alpha = 2 / (period + 1), seeded with the SMA of the first `period` values."""
+    values = as_array(values)
+    result = np.full(len(values), np.nan)
+    if period <= 0 or len(values) < period:
+        return result
+    seeded = values.copy()
+    seeded[:period - 1] = np.nan
+    seeded[period - 1] = values[:period].mean()
+    return pd.Series(seeded).ewm(alpha=2 / (period + 1), adjust=False).mean().to_numpy()
+
+
+def _rolling_extreme(values: Sequence[float], period: int, combine: np.ufunc, fill: float) -> np.ndarray:
+    # van Herk/Gil-Werman: split into blocks of `period`, any window spans at most two
+    # blocks, so its extreme is the suffix extreme of one and the prefix extreme of the next
+    values = as_array(values)
+    n = len(values)
+    result = np.full(n, np.nan)
+    if period <= 0 or n < period:
+        return result
+    padded = np.full(-(-n // period) * period, fill)
+    padded[:n] = values
+    blocks = padded.reshape(-1, period)
+    prefix = combine.accumulate(blocks, axis=1).ravel()
+    suffix = combine.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+    result[period - 1:] = combine(suffix[:n - period + 1], prefix[period - 1:n])
+    return result
+
+
+def rolling_max(values: Sequence[float], period: int) -> np.ndarray:
+    """Max of the last `period` values at every index, NaN during warm-up."""
+    return _rolling_extreme(values, period, np.maximum, -np.inf)
+
+
+def rolling_min(values: Sequence[float], period: int) -> np.ndarray:
+    """Min of the last `period` values at every index, NaN during warm-up."""
+    return _rolling_extreme(values, period, np.minimum, np.inf)
+
+
+def shift(values: Sequence[float], periods: int) -> np.ndarray:
+    """Value from `periods` bars ago at every index (from the future if negative), NaN where there is none."""
+    values = as_array(values)
+    result = np.full(len(values), np.nan)
+    if periods >= 0 and periods < len(values):
+        result[periods:] = values[:len(values) - periods]
+    elif periods < 0 and -periods < len(values):
+        result[:periods] = values[-periods:]
+    return result
+
+
+class RollingExtreme:
+    """Streaming max (or min) of the last `period` values, amortized O(1) per update."""
+
+    def __init__(self, period: int, is_max=True):
+        self.period = period
+        self.is_max = is_max
+        # Monotonic (index, value) pairs, the front holding the current extreme
+        self.window = deque()
+        self.count = 0
+
+    def update(self, value: float) -> float:
+        window = self.window
+        if self.is_max:
+            while window and window[-1][1] <= value:
+                window.pop()
+        else:
+            while window and window[-1][1] >= value:
+                window.pop()
+        window.append((self.count, value))
+        self.count += 1
+        if window[0][0] <= self.count - 1 - self.period:
+            window.popleft()
+        return window[0][1] if self.count >= self.period else np.nan
@@ -1,25 +1,67 @@
-from data_types import BarData
-from typing import List, Literal, Union
+from data_types import BarData, Bars, BarSeries
+from typing import TYPE_CHECKING, List, Literal, Optional, Union
 from abc import ABC, abstractmethod
-import plotly.graph_objects as go
+from profiler import profiler
+from toolbox.features import Feature, FeatureSet, compute_feature
+import numpy as np
+
+if TYPE_CHECKING:
+    import plotly.graph_objects as go
 
 DataType = Union[Literal["Latest", "Historical"], List]
 
 
 class ToolBase(ABC):
+    # Attributes set by calculate_historical_data that add_to_fig relies on
+    cached_attributes = ('data',)
+
+    def __init__(self):
+        # Number of bars fed through update so far
+        self.bar_count = 0
+        self.latest = None
+        # Optional IndicatorCache used by get_historical_data
+        self.cache = None
+        # Optional FeatureSet shared with other tools, see share_features
+        self.features: Optional[FeatureSet] = None
+
+    def get_historical_data(self, bars: Bars):
+        """calculate_historical_data, served from self.cache when one is set."""
+        with profiler.stage(f"{type(self).__name__}.get_historical_data"):
+            if self.cache is None:
+                return self.calculate_historical_data(bars)
+            return self.cache.get_or_compute(self, bars)
+
+    def get_latest_data(self, bars: Bars):
+        """Feed the bars not seen yet through update and return the latest value."""
+        with profiler.stage(f"{type(self).__name__}.get_latest_data"):
+            bars = BarSeries.coerce(bars)
+            for bar in bars[self.bar_count:].to_bar_dicts():
+                self.update(bar)
+            return self.latest
+
+    def get_features(self) -> List[Feature]:
+        """Features calculate_historical_data reads through get_feature, so they can be shared."""
+        return []
+
+    def get_feature(self, bars: BarSeries, feature: Feature) -> np.ndarray:
+        """The shared feature when self.features holds these bars, computed on the spot otherwise."""
+        if self.features is not None and self.features.bars is bars:
+            return self.features.get(feature)
+        return compute_feature(bars, feature)
+
     @abstractmethod
-    def get_latest_data(self, bars: List[BarData]):
-        """Retrieve the latest data."""
+    def update(self, bar: BarData):
+        """Add the next bar to the rolling state and return the latest value, amortized O(1)."""
         pass
 
     @abstractmethod
-    def calculate_historical_data(self, bars: List[BarData]):
+    def calculate_historical_data(self, bars: Bars):
         """Retrieve historical data."""
         pass
 
     @abstractmethod
-    def add_to_fig(self, fig: go.Figure, bars: List[BarData], data_type: DataType = "Historical"):
-        """Add the stuff to the figure."""
+    def add_to_fig(self, fig: "go.Figure", bars: Bars, data_type: DataType = "Historical"):
+        """Add the stuff to the figure. Import plotly in here, tools are used without plotting too."""
         pass
 
     @abstractmethod
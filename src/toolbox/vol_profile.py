@@ -1,102 +1,278 @@
-from typing import List, Tuple, Optional
+from typing import Literal, Optional, Tuple, TypedDict
 from toolbox.tool_base import ToolBase
-from dataclasses import dataclass, field
+from dataclasses import dataclass
+from data_types import BarSeries
+import pandas as pd
+import numpy as np
+
+VolumeProfileMode = Literal["Fixed", "Rolling", "Session"]
 
 
 @dataclass
 class VolumeProfileConfig:
-    # % from lowest point to highest point
-    levels: List[float] = field(default_factory=lambda: [
-                                0, 20, 40, 60, 80, 100])
+    # Number of equal price bins between the lowest low and the highest high
+    bins: int = 200
+    # % of the volume, taken from the busiest bins down, that makes up the value area
+    value_area: float = 70
+    # Fixed: one profile over every bar. Rolling: over the last `window` bars.
+    # Session: restarts every `session`, a fixed length such as "1D" or "4h"
+    mode: VolumeProfileMode = "Fixed"
+    window: int = 500
+    session: str = "1D"
     # >=1, I.E for val "3" the highest bar will take 1/3 of plot width
     plot_bar_ratio: float = 3
 
 
+# Profile at one bar, as returned by update
+class VolumeProfileValue(TypedDict):
+    # bins + 1 prices, from the lowest low to the highest high
+    edges: np.ndarray
+    # Volume per bin
+    volumes: np.ndarray
+    # Point of control, the center of the busiest bin
+    poc: float
+    value_area_low: float
+    value_area_high: float
+
+
+# Profile at the last bar. Rolling and Session modes add the point of control
+# and value area of the profile ending at every bar
+class VolumeProfileData(VolumeProfileValue, total=False):
+    pocs: np.ndarray
+    value_area_lows: np.ndarray
+    value_area_highs: np.ndarray
+
+
+def distribute_volume(lows: np.ndarray, highs: np.ndarray, volumes: np.ndarray, lowest: float, bin_width: float, bins: int):
+    """
+    Splits every bar's volume over the bins its low-high span overlaps, in
+    proportion to the overlap. Returns (bar indices, bin indices, bin volumes),
+    grouped by bar in bar order.
+    """
+    first = np.clip(((lows - lowest) // bin_width).astype(np.int64), 0, bins - 1)
+    last = np.clip(((highs - lowest) // bin_width).astype(np.int64), first, bins - 1)
+    counts = last - first + 1
+    bar_indices = np.repeat(np.arange(len(lows)), counts)
+    starts = np.cumsum(counts) - counts
+    bin_indices = first[bar_indices] + \
+        np.arange(len(bar_indices)) - starts[bar_indices]
+    bin_lows = lowest + bin_indices * bin_width
+    overlaps = np.minimum(highs[bar_indices], bin_lows + bin_width) - \
+        np.maximum(lows[bar_indices], bin_lows)
+    # A bar without a span sits in a single bin and keeps all its volume there
+    overlaps = np.where(highs[bar_indices] > lows[bar_indices],
+                        np.clip(overlaps, 0, None), 1.0)
+    totals = np.bincount(bar_indices, weights=overlaps, minlength=len(lows))
+    totals = np.where(totals > 0, totals, 1.0)
+    return bar_indices, bin_indices, volumes[bar_indices] * overlaps / totals[bar_indices]
+
+
 class VolumeProfile(ToolBase):
     def __init__(self, config: Optional[VolumeProfileConfig] = None):
+        super().__init__()
         # Default configuration if none is provided
         default_config = VolumeProfileConfig()
 
         # Extract configuration values, falling back to defaults where necessary
         config = config or default_config
+        self.config = config
 
-        self.levels = config.levels or default_config.levels
-        self.levels.sort()
+        self.bins = max(config.bins or default_config.bins, 1)
+        self.value_area = config.value_area or default_config.value_area
+        self.mode = config.mode or default_config.mode
+        self.window = max(config.window or default_config.window, 1)
+        self.session = config.session or default_config.session
+        self.session_length = pd.Timedelta(self.session).value
         self.plot_bar_ratio = config.plot_bar_ratio or default_config.plot_bar_ratio
         self.plot_bar_ratio = max(self.plot_bar_ratio, 1)
-        self.data = Tuple[List[float], float]
-
-    def get_latest_data(self, bars):
-        return super().get_latest_data(bars)
-
-    def calculate_historical_data(self, bars) -> Tuple[List[float], float]:
-
-        # Find the highest and lowest points in the data
-        lowest = min(bar['low'] for bar in bars)
-        highest = max(bar['high'] for bar in bars)
-
-        # Calculate the reference volume between each pair of consecutive levels
-        reference_volume = 0
-        volume_profile = []
-
-        # Initialize volume counters for each level range
-        level_volumes = [0] * (len(self.levels) - 1)
-        distance = highest - lowest
-        for bar in bars:
-            bar_low = bar['low']
-            bar_high = bar['high']
-            bar_volume = bar['volume']
-
-            # For each level range, check if the bar's high-low range intersects with it
-            for i in range(len(self.levels) - 1):
-                level_start = lowest + (self.levels[i] / 100) * distance
-                level_end = lowest + (self.levels[i + 1] / 100) * distance
-
-                if bar_high >= level_start and bar_low <= level_end:
-                    # The bar intersects this level range, add its volume to the corresponding level
-                    level_volumes[i] += bar_volume
-
-        # Calculate the reference volume (highest volume between two consecutive levels)
-        reference_volume = max(level_volumes)
-
-        # Normalize the volume for each level as a percentage of the reference volume
-        for volume in level_volumes:
-            volume_profile.append((volume / reference_volume)
-                                  if reference_volume else 0)
-        self.data = volume_profile, reference_volume
+        self.data: Optional[VolumeProfileData] = None
+        # Rolling state for update. Bars are kept since a new high or low moves every bin,
+        # as low, high and volume rows grown by doubling so rebuilding never copies them
+        self.bar_arrays = np.empty((3, 1024))
+        self.profile = np.zeros(self.bins)
+        # Index of the first bar in self.profile
+        self.profile_start = 0
+        self.session_key = None
+        self.lowest = float('inf')
+        self.highest = float('-inf')
+
+    # O(bins) per bar inside the high-low range seen so far. A new high or low moves every
+    # edge, so the bars of the profile are re-binned: O(window) Rolling, O(session bars)
+    # Session and O(n) Fixed, about O(sqrt(n)) amortized per bar on a random walk. Re-binning
+    # the bin volumes instead would be O(bins) but drift from calculate_historical_data
+    def update(self, bar) -> VolumeProfileValue:
+        index = self.bar_count
+        self.bar_count += 1
+        if index == self.bar_arrays.shape[1]:
+            self.bar_arrays = np.concatenate(
+                (self.bar_arrays, np.empty_like(self.bar_arrays)), axis=1)
+        self.bar_arrays[:, index] = bar['low'], bar['high'], bar['volume']
+
+        is_new_session = False
+        if self.mode == "Session":
+            session_key = pd.Timestamp(bar['timestamp']).value // self.session_length
+            is_new_session = session_key != self.session_key
+            if is_new_session:
+                self.session_key = session_key
+                self.profile_start = index
+        elif self.mode == "Rolling":
+            self.profile_start = max(index + 1 - self.window, 0)
+
+        if bar['low'] < self.lowest or bar['high'] > self.highest:
+            self.lowest = min(self.lowest, bar['low'])
+            self.highest = max(self.highest, bar['high'])
+            self.profile = self.__get_profile(self.__get_bar_arrays(self.profile_start, index + 1))
+        else:
+            if is_new_session:
+                self.profile = np.zeros(self.bins)
+            self.__add_bar(self.profile, *self.bar_arrays[:, index])
+            if self.mode == "Rolling" and index >= self.window:
+                self.__add_bar(self.profile, *self.bar_arrays[:, index - self.window], sign=-1)
+        self.latest = self.__get_value(self.profile)
+        return self.latest
+
+    def calculate_historical_data(self, bars) -> VolumeProfileData:
+        bars = BarSeries.coerce(bars)
+        bar_arrays = (bars.low, bars.high, bars.volume)
+        if self.mode == "Fixed":
+            self.lowest = float(bars.low.min())
+            self.highest = float(bars.high.max())
+            self.data = self.__get_value(self.__get_profile(bar_arrays))
+            return self.data
+
+        # Like update, every bar is binned between the lowest low and highest high up
+        # to it. Where they move the profile is re-binned, in between it slides one bar
+        # at a time, adding the bar that enters and removing the one that leaves
+        lowests = np.minimum.accumulate(bars.low)
+        highests = np.maximum.accumulate(bars.high)
+        run_starts = np.flatnonzero(np.concatenate(
+            ([True], (lowests[1:] != lowests[:-1]) | (highests[1:] != highests[:-1]))))
+        run_ends = np.append(run_starts[1:], len(bars))
+        session_keys = bars.timestamp // self.session_length
+        is_new_session = np.concatenate(([True], session_keys[1:] != session_keys[:-1]))
+        indices = np.arange(len(bars))
+        # First bar of the profile ending at every bar
+        profile_starts = np.maximum.accumulate(np.where(is_new_session, indices, 0)) \
+            if self.mode == "Session" else np.maximum(indices + 1 - self.window, 0)
+        summaries = np.full((3, len(bars)), np.nan)
+        for run_start, run_end in zip(run_starts.tolist(), run_ends.tolist()):
+            self.lowest, self.highest = float(lowests[run_start]), float(highests[run_start])
+            first = int(profile_starts[run_start])
+            bar_indices, bin_indices, bin_volumes = distribute_volume(
+                *(array[first:run_end] for array in bar_arrays), self.lowest, self.__get_bin_width(), self.bins)
+            offsets = np.searchsorted(bar_indices, np.arange(run_end - first + 1))
+            end = offsets[run_start - first + 1]
+            profile = np.bincount(bin_indices[:end], weights=bin_volumes[:end], minlength=self.bins)
+            summaries[:, run_start] = self.__summarize(profile)
+            for i in range(run_start + 1, run_end):
+                if self.mode == "Session" and is_new_session[i]:
+                    profile = np.zeros(self.bins)
+                entering = i - first
+                profile[bin_indices[offsets[entering]:offsets[entering + 1]]
+                        ] += bin_volumes[offsets[entering]:offsets[entering + 1]]
+                if self.mode == "Rolling" and i >= self.window:
+                    leaving = i - self.window - first
+                    profile[bin_indices[offsets[leaving]:offsets[leaving + 1]]
+                            ] -= bin_volumes[offsets[leaving]:offsets[leaving + 1]]
+                summaries[:, i] = self.__summarize(profile)
+        self.data = self.__get_value(profile)
+        self.data['pocs'], self.data['value_area_lows'], self.data['value_area_highs'] = summaries
         return self.data
 
+    def __get_bin_width(self) -> float:
+        # A flat series still needs a non-zero width to be binned
+        return (self.highest - self.lowest) / self.bins or 1.0
+
+    def __get_edges(self) -> np.ndarray:
+        return self.lowest + np.arange(self.bins + 1) * self.__get_bin_width()
+
+    def __get_bar_arrays(self, start: int, end: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        return tuple(self.bar_arrays[:, start:end])
+
+    def __get_profile(self, bar_arrays) -> np.ndarray:
+        _, bin_indices, bin_volumes = distribute_volume(
+            *bar_arrays, self.lowest, self.__get_bin_width(), self.bins)
+        return np.bincount(bin_indices, weights=bin_volumes, minlength=self.bins)
+
+    def __add_bar(self, profile: np.ndarray, low: float, high: float, volume: float, sign=1):
+        """distribute_volume for a single bar, in plain floats since NumPy's per-call overhead dominates here."""
+        bin_width = self.__get_bin_width()
+        first = min(max(int((low - self.lowest) // bin_width), 0), self.bins - 1)
+        last = min(max(int((high - self.lowest) // bin_width), first), self.bins - 1)
+        if high <= low:
+            profile[first] += sign * volume
+            return
+        overlaps = []
+        for bin_index in range(first, last + 1):
+            bin_low = self.lowest + bin_index * bin_width
+            overlaps.append(max(min(high, bin_low + bin_width) - max(low, bin_low), 0.0))
+        total = sum(overlaps) or 1.0
+        for offset, overlap in enumerate(overlaps):
+            profile[first + offset] += sign * volume * overlap / total
+
+    def __summarize(self, profile: np.ndarray) -> Tuple[float, float, float]:
+        """Point of control, value area low and value area high of a profile."""
+        total = profile.sum()
+        if total <= 0:
+            return np.nan, np.nan, np.nan
+        bin_width = self.__get_bin_width()
+        # Busiest bins first, ties broken towards the lower price like argmax
+        order = np.argsort(-profile, kind='stable')
+        count = int(np.searchsorted(np.cumsum(profile[order]),
+                    total * self.value_area / 100)) + 1
+        value_area_bins = order[:count]
+        return (self.lowest + (order[0] + 0.5) * bin_width,
+                self.lowest + value_area_bins.min() * bin_width,
+                self.lowest + (value_area_bins.max() + 1) * bin_width)
+
+    def __get_value(self, profile: np.ndarray) -> VolumeProfileValue:
+        poc, value_area_low, value_area_high = self.__summarize(profile)
+        return {
+            "edges": self.__get_edges(),
+            "volumes": profile.copy(),
+            "poc": poc,
+            "value_area_low": value_area_low,
+            "value_area_high": value_area_high,
+        }
+
     def add_to_fig(self, fig, bars, data_type="Historical"):
+        import plotly.graph_objects as go
+        bars = BarSeries.coerce(bars)
         if data_type == "Historical":
-            volume_profile, reference_volume = self.calculate_historical_data(bars)
+            data = self.get_historical_data(bars)
         elif data_type == "Latest":
-            volume_profile, reference_volume = self.get_latest_data(bars)
+            data = self.get_latest_data(bars)
+        else:
+            data = self.data
+
+        timestamps = bars.datetimes
+        edges, volumes = data['edges'], data['volumes']
+        reference_volume = volumes.max()
+        if reference_volume > 0:
+            # One outline traced bin by bin instead of a shape per bin
+            max_shape_width = len(bars) // self.plot_bar_ratio
+            shape_widths = (max_shape_width * volumes /
+                            reference_volume).astype(np.int64)
+            left = timestamps[len(bars) - np.maximum(shape_widths, 1)]
+            fig.add_trace(go.Scatter(
+                x=np.concatenate(([timestamps[-1]], np.repeat(left, 2), [timestamps[-1]])),
+                y=np.concatenate(([edges[0]], np.column_stack(
+                    (edges[:-1], edges[1:])).ravel(), [edges[-1]])),
+                fill='toself', fillcolor='rgba(90, 34, 139, 0.2)', line={"width": 0},
+                mode='lines', name='Volume Profile', hoverinfo='skip'))
+
+        if 'pocs' in data:
+            for name, column, dash in (("POC", 'pocs', 'solid'),
+                                       ("Value Area Low", 'value_area_lows', 'dot'),
+                                       ("Value Area High", 'value_area_highs', 'dot')):
+                fig.add_trace(go.Scatter(x=timestamps, y=data[column], mode='lines', name=name,
+                                         line={"color": 'rgba(90, 34, 139, 0.8)', "width": 1, "dash": dash}))
         else:
-            volume_profile, reference_volume = self.data
-
-        timestamps = [bar['timestamp'] for bar in bars]
-        # Find the highest and lowest points in the data
-        lowest = min(bar['low'] for bar in bars)
-        highest = max(bar['high'] for bar in bars)
-        distance = highest-lowest
-        max_shape_width = len(bars) // self.plot_bar_ratio
-        level_start = lowest + (self.levels[0] / 100) * distance
-        for i in range(1, len(self.levels)):
-            level_end = lowest + (self.levels[i] / 100) * distance
-            color = 'rgba(90, 34, 139, 0.2)'
-            shape_width = int(max_shape_width*volume_profile[i-1])
-            if (shape_width):
-                fig.add_shape(
-                    type="rect",
-                    name=f"Validated {type} Range",
-                    x0=timestamps[-shape_width],  # Start from the ending_index
-                    x1=timestamps[-1],  # End at the last timestamp
-                    y0=level_start,  # Lower bound of the range
-                    y1=level_end,  # Upper bound of the range
-                    fillcolor=color,
-                    line={"width": 0},  # No border
-                )
-            level_start = level_end
+            for name, value, dash in (("POC", data['poc'], 'solid'),
+                                      ("Value Area Low", data['value_area_low'], 'dot'),
+                                      ("Value Area High", data['value_area_high'], 'dot')):
+                fig.add_shape(type="line", name=name, x0=timestamps[0], x1=timestamps[-1], y0=value, y1=value,
+                              line={"color": 'rgba(90, 34, 139, 0.8)', "width": 1, "dash": dash})
 
     def get_nr_of_subplots(self):
         return 0
@@ -1,56 +1,60 @@
-from data_types import BarData
+from data_types import Bars, BarSeries
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
-from typing import List
-from toolbox import FibonacciRetracement, MARibbon, PotentialRange, Ichimoku, VolumeProfile, ToolName
-
-
-def __get__tool(tool_name: ToolName):
-    if (tool_name == 'Range'):
-        return PotentialRange()
-    elif (tool_name == "Ichimoku"):
-        return Ichimoku()
-    elif (tool_name == "FibonacciRetracement"):
-        return FibonacciRetracement()
-    elif (tool_name == "MARibbon"):
-        return MARibbon()
-    elif (tool_name == "VolumeProfile"):
-        return VolumeProfile()
-    else:
-        raise ValueError(f"Invalid tool name: {tool_name}")
-
-
-def look_at_this_graph(bars: List[BarData], symbol, timeframe, tool_names: List[ToolName]):
-    # Extract data for plotting
-    timestamps = [bar['timestamp'] for bar in bars]
-    opens = [bar['open'] for bar in bars]
-    highs = [bar['high'] for bar in bars]
-    lows = [bar['low'] for bar in bars]
-    closes = [bar['close'] for bar in bars]
+from typing import List, Optional
+from indicator_cache import IndicatorCache
+from decimation import RenderMode, aggregate_candles, decimate_figure
+from profiler import profiler
+from toolbox import ToolName, create_tool
+from toolbox.features import share_features
 
+
+def look_at_this_graph(bars: Bars, symbol, timeframe, tool_names: List[ToolName], cache: Optional[IndicatorCache] = None,
+                       render_mode: RenderMode = "WebGL", max_points=2000):
+    fig = build_figure(bars, symbol, timeframe, tool_names,
+                       cache, render_mode, max_points)
+    # Show the plot
+    with profiler.stage("fig.show"):
+        fig.show()
+
+
+@profiler.timed()
+def build_figure(bars: Bars, symbol, timeframe, tool_names: List[ToolName], cache: Optional[IndicatorCache] = None,
+                 render_mode: RenderMode = "WebGL", max_points=2000) -> go.Figure:
+    bars = BarSeries.coerce(bars)
+
+    tools = [create_tool(tool_name) for tool_name in tool_names]
     subplot_count = 1
-    for tool_name in tool_names:
-        tool = __get__tool(tool_name)
+    for tool in tools:
+        tool.cache = cache
         subplot_count += tool.get_nr_of_subplots()
+    # Rolling windows several tools need are computed once
+    share_features(tools, bars)
 
     fig = make_subplots(rows=subplot_count, cols=1,
                         shared_xaxes=True, vertical_spacing=0.05)
 
+    # More candles than the screen has pixels just blur together
+    candles = aggregate_candles(
+        bars, max_points) if render_mode == "WebGL" else bars
     fig.add_trace(
         go.Candlestick(
-            x=timestamps,
-            open=opens,
-            high=highs,
-            low=lows,
-            close=closes,
+            x=candles.datetimes,
+            open=candles.open,
+            high=candles.high,
+            low=candles.low,
+            close=candles.close,
             name=f"{symbol} {timeframe}"
         ),
         row=1, col=1
     )
 
-    for tool_name in tool_names:
-        tool = __get__tool(tool_name)
-        tool.add_to_fig(fig, bars)
+    for tool in tools:
+        with profiler.stage(f"{type(tool).__name__}.add_to_fig"):
+            tool.add_to_fig(fig, bars)
+    if render_mode == "WebGL":
+        with profiler.stage("decimate_figure"):
+            decimate_figure(fig, max_points)
 
     # Update layout for better visualization
     fig.update_layout(
@@ -58,6 +62,4 @@ def look_at_this_graph(bars: List[BarData], symbol, timeframe, tool_names: List[
         xaxis_rangeslider_visible=False,
         template="plotly_dark",
     )
-
-    # Show the plot
-    fig.show()
+    return fig
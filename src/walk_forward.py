@@ -0,0 +1,205 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass, field, replace
+from typing import Dict, Iterator, List, Optional, Tuple
+from data_types import BarSeries, TimeframeString
+from bar_store import BarStore
+from indicator_cache import IndicatorCache
+from backtest import BacktestConfig, BacktestResult, get_stats, run_backtest
+from strategies import Strategy1
+from sweep import Params, SweepResult, get_strategy_configs, rank
+from toolbox.features import FeatureSet
+import numpy as np
+import time
+
+
+@dataclass
+class WalkForwardJob:
+    ticker: str
+    low_timeframe: TimeframeString
+    high_timeframe: TimeframeString
+    store_dirname: str
+    backtest_config: BacktestConfig
+    # Tried on every train segment, the best one by metric is run on the test segment
+    combinations: List[Params] = field(default_factory=lambda: [{}])
+    metric: str = 'sharpe'
+
+
+@dataclass
+class Window:
+    index: int
+    # Low timeframe bar indices, the train segment ends where the test segment starts
+    train_start: int
+    test_start: int
+    test_end: int
+
+
+@dataclass
+class WindowResult:
+    window: Window
+    # Combination picked on the train segment
+    params: Params
+    train_stats: Dict[str, float]
+    # Signals of the picked combination from the bar before the test segment to its last bar
+    signals: Optional[np.ndarray]
+    seconds: float
+    error: Optional[str] = None
+    # Set by stitch, from the test segment's part of the out-of-sample backtest
+    test_stats: Dict[str, float] = field(default_factory=dict)
+
+
+def get_windows(bar_count: int, train_size: int, test_size: int, step: Optional[int] = None) -> List[Window]:
+    """
+    Rolling train/test windows over bar_count bars, moved by step bars, by
+    default test_size so the test segments follow each other. Only windows
+    whose test segment fits entirely are kept.
+    """
+    step = step or test_size
+    if train_size < 1 or test_size < 1:
+        raise ValueError("Train and test sizes must be at least 1 bar")
+    if step < test_size:
+        raise ValueError(f"Step {step} would overlap test segments of {test_size} bars")
+    return [Window(index, train_start, train_start + train_size, train_start + train_size + test_size)
+            for index, train_start in enumerate(range(0, bar_count - train_size - test_size + 1, step))]
+
+
+# Per worker process state, set once by _init_worker
+worker_job: Optional[WalkForwardJob] = None
+worker_bars = None
+worker_cache: Optional[IndicatorCache] = None
+
+
+def _init_worker(job: WalkForwardJob):
+    global worker_job, worker_bars, worker_cache
+    worker_job = job
+    # Memory mapped, so every worker shares the page cache and windows are sliced out as views
+    store = BarStore(job.store_dirname)
+    worker_bars = (store.read(job.ticker, job.low_timeframe),
+                   store.read(job.ticker, job.high_timeframe))
+    # Combinations of a window that only differ in one tool's config reuse the other tools' results
+    worker_cache = IndicatorCache()
+
+
+def get_window_bars(bars_low_timeframe: BarSeries, bars_high_timeframe: BarSeries, window: Window) -> Tuple[BarSeries, BarSeries]:
+    """
+    Every bar up to the end of the window's test segment, views of both
+    series. The tools start from the first bar like in a full history run,
+    Fibonacci's expanding swings and the Range swing chain depend on every
+    bar before, so the signals of the window are the full history run's
+    while no bar after the test segment is ever seen.
+    """
+    bars_low_timeframe = bars_low_timeframe[:window.test_end]
+    # High timeframe bars opened by then, align only uses the ones closed by then
+    high_timeframe_end = np.searchsorted(bars_high_timeframe.timestamp,
+                                         bars_low_timeframe.timestamp[-1], side='right')
+    return bars_low_timeframe, bars_high_timeframe[:high_timeframe_end]
+
+
+def backtest_segment(bars: BarSeries, signals: np.ndarray, start: int, end: int, config: BacktestConfig) -> BacktestResult:
+    """Backtest of bars[start:end], holding the position signals[start - 1] asks for from the first bar."""
+    previous_signal = signals[start - 1] if start else 0.0
+    return run_backtest(bars[start:end], signals[start:end], config, previous_signal)
+
+
+def _run_window(window: Window) -> WindowResult:
+    started = time.perf_counter()
+    config = worker_job.backtest_config
+    try:
+        bars = get_window_bars(*worker_bars, window)
+        # Combinations with different configs of a tool still share its rolling windows
+        feature_sets = tuple(FeatureSet(series) for series in bars)
+
+        best: Optional[SweepResult] = None
+        best_signals = None
+        for params in worker_job.combinations:
+            try:
+                strategy = Strategy1(worker_cache, config, feature_sets=feature_sets,
+                                     **get_strategy_configs(params))
+                signals = strategy.get_signals(*bars)
+                train = backtest_segment(bars[0], signals, window.train_start, window.test_start, config)
+                result = SweepResult(params, train.stats, 0.0)
+            except Exception as error:
+                result, signals = SweepResult(params, {}, 0.0, repr(error)), None
+            # rank is stable, a tie keeps the earlier combination
+            if best is None or rank([best, result], worker_job.metric)[0] is result:
+                best, best_signals = result, signals
+        if best.error:
+            return WindowResult(window, best.params, {}, None, time.perf_counter() - started, best.error)
+        return WindowResult(window, best.params, best.stats, best_signals[window.test_start - 1:window.test_end],
+                            time.perf_counter() - started)
+    except Exception as error:
+        return WindowResult(window, {}, {}, None, time.perf_counter() - started, repr(error))
+
+
+def run_walk_forward(job: WalkForwardJob, windows: List[Window], workers=None) -> Iterator[WindowResult]:
+    """Runs every window on a process pool, yielding results as they finish."""
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(job,)) as executor:
+        futures = [executor.submit(_run_window, window) for window in windows]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def stitch(results: List[WindowResult], bars: BarSeries, config: BacktestConfig) -> Optional[BacktestResult]:
+    """
+    One backtest from the first test segment to the end of the last one,
+    trading every segment's signals and staying flat wherever no segment
+    was tested, between segments or for failed windows. Positions, cash and
+    open trades carry over from segment to segment like in a full history
+    run. Sets every result's test_stats from its segment.
+    """
+    results = sorted((result for result in results if result.signals is not None),
+                     key=lambda result: result.window.index)
+    if not results:
+        return None
+    start, end = results[0].window.test_start, results[-1].window.test_end
+    signals = np.zeros(end - start)
+    for result in results:
+        signals[result.window.test_start - start:result.window.test_end - start] = result.signals[1:]
+    stitched = run_backtest(bars[start:end], signals, config, results[0].signals[0])
+    for result in results:
+        result.test_stats = get_segment_stats(stitched, result.window.test_start - start,
+                                              result.window.test_end - start, config)
+    return stitched
+
+
+def get_segment_stats(result: BacktestResult, start: int, end: int, config: BacktestConfig) -> Dict[str, float]:
+    """Stats of the bars start:end of result, starting from the equity before them and counting the trades closed in them."""
+    initial_cash = result.equity[start - 1] if start else config.initial_cash
+    timestamps = result.timestamps[start:end]
+    trades = [trade for trade in result.trades
+              if trade['exit_timestamp'] >= timestamps[0] and trade['exit_timestamp'] <= timestamps[-1]]
+    return get_stats(timestamps, result.positions[start:end], result.equity[start:end], trades,
+                     replace(config, initial_cash=float(initial_cash)))
+
+
+def format_result(result: WindowResult, metric: str):
+    params = ', '.join(f"{name}={value}" for name, value in result.params.items()) or 'defaults'
+    if result.error:
+        return f"{result.window.index:>6}{'error':>12}  {params}  {result.error}"
+    line = (f"{result.window.index:>6}{result.window.test_start:>10}{result.window.test_end:>10}"
+            f"{result.train_stats.get(metric, 0):>12.3f}")
+    stats = result.test_stats
+    # Test segments only have stats once stitched
+    line += (f"{stats.get(metric, 0):>12.3f}{stats['trades']:>8}{stats['total_return_pct']:>10.2f}"
+             f"{stats['max_drawdown_pct']:>10.2f}" if stats else f"{'':>40}")
+    return f"{line}{result.seconds:>9.2f}  {params}"
+
+
+def format_table(results: List[WindowResult], metric: str):
+    lines = [f"Train and Test are the {metric} of the segments",
+             f"{'Window':>6}{'Test from':>10}{'Test to':>10}{'Train':>12}{'Test':>12}"
+             f"{'Trades':>8}{'Return %':>10}{'Max DD %':>10}{'Seconds':>9}  Params"]
+    lines += [format_result(result, metric)
+              for result in sorted(results, key=lambda result: result.window.index)]
+    return "\n".join(lines)
+
+
+def format_summary(results: List[WindowResult], stitched: Optional[BacktestResult], seconds: float):
+    failed = sum(result.error is not None for result in results)
+    tested = [result for result in results if result.test_stats]
+    profitable = sum(result.test_stats['total_return_pct'] > 0 for result in tested)
+    lines = [f"{len(results)} windows in {seconds:.2f}s, {failed} failed, {profitable}/{len(tested)} profitable"]
+    if stitched is not None:
+        stats = stitched.stats
+        lines.append(f"Out of sample: {stats['trades']} trades, {stats['total_return_pct']:.2f}% return, "
+                     f"{stats['max_drawdown_pct']:.2f}% max drawdown, sharpe {stats['sharpe']:.3f}")
+    return "\n".join(lines)
@@ -0,0 +1,92 @@
+"""
+FakeCryptoClient, a local stand-in for alpaca-py's CryptoHistoricalDataClient,
+so no network or keys are needed, and FlakyClient, which adds latency and
+errors to it.
+"""
+from typing import Dict, NamedTuple, Optional
+from data_types import BAR_COLUMNS, BarSeries
+import datetime
+import random
+import threading
+import time
+import numpy as np
+import pandas as pd
+
+
+class FakeBar(NamedTuple):
+    timestamp: datetime.datetime
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: float
+
+
+class FakeCryptoClient:
+    """
+    Serves get_crypto_bars from bars in memory the way the SDK does: every
+    bar from start to end, both inclusive, up to limit, and no entry for a
+    symbol without bars. Every request is kept in requests.
+    """
+
+    def __init__(self, bars: BarSeries):
+        self.bars = bars
+        self.requests = []
+
+    def get_crypto_bars(self, request_params):
+        self.requests.append(request_params)
+        first = int(np.searchsorted(self.bars.timestamp, get_nanoseconds(request_params.start)))
+        last = len(self.bars)
+        if request_params.end is not None:
+            last = int(np.searchsorted(self.bars.timestamp, get_nanoseconds(request_params.end), side='right'))
+        if request_params.limit:
+            last = min(last, first + request_params.limit)
+        if first >= last:
+            return {}
+        bars = self.bars[first:last]
+        datetimes = pd.to_datetime(bars.timestamp, unit='ns', utc=True).to_pydatetime()
+        rows = [FakeBar(*row) for row in zip(datetimes, *(getattr(bars, column).tolist()
+                                                          for column in BAR_COLUMNS[1:]))]
+        return {symbol: rows for symbol in request_params.symbol_or_symbols}
+
+
+class FlakyClient:
+    """
+    Wraps a client, taking latency seconds for every request. A request
+    fails with a ConnectionError at error_rate, and always with the error
+    errors holds for its symbol. After fail_after requests every request
+    fails, as if the connection was gone. Counts are kept per symbol.
+    """
+
+    def __init__(self, client, latency=0.0, error_rate=0.0, errors: Optional[Dict[str, Exception]] = None,
+                 fail_after: Optional[int] = None, seed=0):
+        self.client = client
+        self.latency = latency
+        self.error_rate = error_rate
+        self.errors = errors or {}
+        self.fail_after = fail_after
+        self.random = random.Random(seed)
+        # Shared between the scheduler's threads
+        self.lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.injected: Dict[str, int] = {}
+
+    def get_crypto_bars(self, request_params):
+        symbol = request_params.symbol_or_symbols[0]
+        with self.lock:
+            self.requests[symbol] = self.requests.get(symbol, 0) + 1
+            is_failing = symbol in self.errors or self.random.random() < self.error_rate or \
+                (self.fail_after is not None and sum(self.requests.values()) > self.fail_after)
+            if is_failing:
+                self.injected[symbol] = self.injected.get(symbol, 0) + 1
+        time.sleep(self.latency)
+        if symbol in self.errors:
+            raise self.errors[symbol]
+        if is_failing:
+            raise ConnectionError("Injected connection error")
+        return self.client.get_crypto_bars(request_params)
+
+
+def get_nanoseconds(value: datetime.datetime) -> int:
+    timestamp = pd.Timestamp(value)
+    return (timestamp.tz_localize('UTC') if timestamp.tz is None else timestamp).value
@@ -0,0 +1,149 @@
+"""Downloading into the bar store, against FakeCryptoClient."""
+from data_types import BAR_COLUMNS, BarSeries
+from bar_store import BarStore
+from alpaca_interface import AlpacaInterface
+from fetch_scheduler import FetchJob, FetchScheduler, ThrottledClient, TokenBucket
+from synthetic_bars import generate_bars
+from cli import fetch_into_store
+from fake_alpaca import FakeCryptoClient, FlakyClient, get_nanoseconds
+import datetime
+import time
+import tracemalloc
+import numpy as np
+import pytest
+
+TICKER = 'BTC'
+SYMBOL = 'BTC/USD'
+# Hourly bars keep the number of pages since 2021 small
+TIMEFRAME = '1H'
+
+
+def fetch(store: BarStore, client, full=False) -> int:
+    return fetch_into_store(store, AlpacaInterface(SYMBOL, TIMEFRAME, data_client=client), TICKER, TIMEFRAME, full)
+
+
+def assert_stored(store: BarStore, bars: BarSeries, ticker=TICKER):
+    stored = store.read(ticker, TIMEFRAME)
+    assert len(stored) == len(bars)
+    for column in BAR_COLUMNS:
+        assert np.array_equal(getattr(stored, column), getattr(bars, column)), f"stored {column} differs"
+
+
+def test_incremental(tmp_path):
+    """
+    Only bars from the last stored one on are requested, the last stored bar,
+    fetched before it closed, is replaced instead of duplicated, and a
+    second run adds nothing.
+    """
+    bars = generate_bars(30000, interval_seconds=3600)
+    store = BarStore(str(tmp_path))
+    stored = bars[:20000]
+    # Still open when it was stored, its close has moved since
+    unfinished = BarSeries(*(np.array(getattr(stored, column)) for column in BAR_COLUMNS))
+    unfinished.close[-1] *= 1.01
+    store.write(TICKER, TIMEFRAME, unfinished)
+    client = FakeCryptoClient(bars)
+    assert fetch(store, client) == 10000
+    assert get_nanoseconds(client.requests[0].start) == stored.timestamp[-1]
+    assert_stored(store, bars)
+    assert fetch(store, FakeCryptoClient(bars)) == 0
+    assert_stored(store, bars)
+
+
+def test_pages():
+    """
+    Pages don't share the bar at their boundary, which Alpaca returns with
+    both, so the stitched history has every bar once in order.
+    """
+    bars = generate_bars(30000, interval_seconds=3600)
+    pages = [page for _, page in AlpacaInterface(SYMBOL, TIMEFRAME, data_client=FakeCryptoClient(bars)).fetch_pages()]
+    stitched = BarSeries.concatenate(pages)
+    assert np.all(np.diff(stitched.timestamp) > 0)
+    assert np.array_equal(stitched.timestamp, bars.timestamp)
+
+
+def test_full(tmp_path):
+    """
+    --full rebuilds from the first bar, whatever was stored before, even
+    with the checkpoint of an interrupted download that wasn't full.
+    """
+    bars = generate_bars(30000, interval_seconds=3600)
+    store = BarStore(str(tmp_path))
+    store.write(TICKER, TIMEFRAME, generate_bars(500, seed=1, interval_seconds=3600))
+    with pytest.raises(ConnectionError):
+        fetch(store, FlakyClient(FakeCryptoClient(bars), fail_after=1))
+    assert store.read_checkpoint(TICKER, TIMEFRAME) is not None
+    client = FakeCryptoClient(bars)
+    fetch(store, client, full=True)
+    assert get_nanoseconds(client.requests[0].start) <= bars.timestamp[0]
+    assert_stored(store, bars)
+
+
+def test_scheduler(tmp_path):
+    """
+    Jobs run concurrently over one throttled client, connection errors are
+    retried until every job has its bars, and a job failing for good fails
+    on its first attempt without holding up the others.
+    """
+    bars = generate_bars(30000, interval_seconds=3600)
+    store = BarStore(str(tmp_path))
+    tickers = [f"T{index}" for index in range(8)]
+    flaky_client = FlakyClient(FakeCryptoClient(bars), latency=0.02, error_rate=0.3,
+                               errors={'BAD/USD': ValueError("Invalid symbol")})
+    data_client = ThrottledClient(flaky_client, TokenBucket(1000, capacity=4),
+                                  max_retries=10, backoff_seconds=0.001)
+
+    def fetch_job(job: FetchJob):
+        client = AlpacaInterface(f"{job.ticker}/USD", job.timeframe, data_client=data_client)
+        return fetch_into_store(store, client, job.ticker, job.timeframe)
+
+    started = time.perf_counter()
+    results = FetchScheduler(fetch_job, concurrency=4).run(
+        [FetchJob(ticker, TIMEFRAME) for ticker in tickers + ['BAD']])
+    wall_seconds = time.perf_counter() - started
+    for result in results:
+        if result.job.ticker == 'BAD':
+            assert result.error is not None
+        else:
+            assert result.error is None
+            assert np.array_equal(store.read(result.job.ticker, TIMEFRAME).timestamp, bars.timestamp)
+    assert flaky_client.requests.get('BAD/USD') == 1
+    assert sum(count for symbol, count in flaky_client.injected.items() if symbol != 'BAD/USD')
+    # Concurrent, the jobs' time adds up to well over the wall time
+    assert wall_seconds < sum(result.seconds for result in results) / 2
+
+
+def test_resume(tmp_path):
+    """
+    A full download cut off partway keeps the pages stored before the cut
+    and a checkpoint, and running it again resumes from the checkpoint
+    instead of starting over, ending with every bar and no checkpoint.
+    """
+    bars = generate_bars(40000, interval_seconds=3600)
+    store = BarStore(str(tmp_path))
+    with pytest.raises(ConnectionError):
+        fetch(store, FlakyClient(FakeCryptoClient(bars), fail_after=2), full=True)
+    checkpoint = store.read_checkpoint(TICKER, TIMEFRAME)
+    assert checkpoint is not None
+    fetched_until = get_nanoseconds(datetime.datetime.fromisoformat(checkpoint['fetched_until']))
+    stored = store.read(TICKER, TIMEFRAME)
+    expected = bars[:int(np.searchsorted(bars.timestamp, fetched_until))]
+    assert len(stored)
+    assert np.array_equal(stored.timestamp, expected.timestamp)
+    client = FakeCryptoClient(bars)
+    fetch(store, client, full=True)
+    assert get_nanoseconds(client.requests[0].start) == fetched_until
+    assert store.read_checkpoint(TICKER, TIMEFRAME) is None
+    assert_stored(store, bars)
+
+
+def test_memory(tmp_path):
+    """Peak memory of a full download stays about one page, whatever the length of the history."""
+    peaks = {}
+    for bar_count in (12000, 48000):
+        client = FakeCryptoClient(generate_bars(bar_count, interval_seconds=3600))
+        tracemalloc.start()
+        fetch(BarStore(str(tmp_path)), client, full=True)
+        peaks[bar_count] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    assert peaks[48000] <= peaks[12000] * 1.5
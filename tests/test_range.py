@@ -0,0 +1,45 @@
+"""PotentialRange's vectorized swing search and interval index against the plain versions they replaced."""
+from synthetic_bars import generate_bars
+from toolbox.range import IntervalIndex, PotentialRange, RangeConfig
+from benchmarks.range_status import LinearScanIndex, time_status
+from benchmarks.swings import track_swings
+import random
+import pytest
+
+
+def get_config(lookback_period: int) -> RangeConfig:
+    return RangeConfig(lookback_period=lookback_period, min_points_distance=lookback_period,
+                       max_points_distance=lookback_period * 8, min_zone_size=0.5)
+
+
+@pytest.mark.parametrize('lookback_period', [1, 5, 20, 50])
+def test_swings_match_swing_tracker(lookback_period):
+    bars = generate_bars(10000)
+    tool = PotentialRange(get_config(lookback_period))
+    assert tool._PotentialRange__find_potential_ranges(bars) == track_swings(tool, bars)
+
+
+@pytest.mark.parametrize('is_known_upfront', [False, True])
+def test_interval_index_matches_linear_scan(is_known_upfront):
+    """Added in any order, with endpoints passed upfront or not, every lookup finds what a scan of every interval does."""
+    generator = random.Random(0)
+    # Few distinct prices, so intervals share endpoints and prices land on them
+    prices = [round(generator.uniform(0, 100), 1) for _ in range(300)]
+    intervals = [tuple(sorted(generator.sample(prices, 2))) for _ in range(500)]
+    index = IntervalIndex(prices if is_known_upfront else ())
+    linear_index = LinearScanIndex()
+    for priority in generator.sample(range(len(intervals)), len(intervals)):
+        low, high = intervals[priority]
+        index.add(low, high, priority, priority)
+        linear_index.add(low, high, priority, priority)
+        for price in generator.sample(prices, 5) + [generator.uniform(-1, 101)]:
+            assert index.find(price) == linear_index.find(price)
+    assert len(index) == len(linear_index)
+
+
+@pytest.mark.parametrize('lookback_period', [5, 20])
+def test_status_matches_linear_scan(lookback_period):
+    bars = generate_bars(10000)
+    _, scan_data, _ = time_status(bars, get_config(lookback_period), LinearScanIndex)
+    _, index_data, _ = time_status(bars, get_config(lookback_period), IntervalIndex)
+    assert index_data == scan_data
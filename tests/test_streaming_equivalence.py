@@ -0,0 +1,98 @@
+"""Feeding bars one at a time through update reproduces calculate_historical_data."""
+from typing import Callable, Dict, List
+from data_types import Bars, BarSeries
+from toolbox.tool_base import ToolBase
+from toolbox import FibonacciRetracement, MARibbon, PotentialRange, Ichimoku, VolumeProfile
+from toolbox.ma_ribbon import MARibbonConfig
+from toolbox.fib_retrace import FibonacciRetracementConfig
+from toolbox.vol_profile import VolumeProfileConfig, VolumeProfileData, VolumeProfileValue
+from synthetic_bars import generate_bars
+import numpy as np
+import pytest
+
+# Picks the value of one bar out of calculate_historical_data's output
+VALUE_AT: Dict[str, Callable] = {
+    'MARibbon': lambda data, index: data[0][:, index],
+    'Ichimoku': lambda data, index: {name: column[index] for name, column in data.items()},
+    'FibonacciRetracement': lambda data, index: data[index],
+    'PotentialRange': lambda data, index: data[index],
+    'VolumeProfile': lambda data, index: get_profile_at(data, index),
+}
+# Tools whose value at a bar only depends on the bars up to it
+CAUSAL_TOOLS = ['MARibbon', 'Ichimoku', 'PotentialRange', 'FibonacciRetracement']
+
+
+def get_profile_at(data: VolumeProfileData, index: int):
+    """
+    Only the profile at the last bar is kept. Rolling and Session modes keep
+    the point of control and value area of every other bar.
+    """
+    if 'pocs' in data and index not in (-1, len(data['pocs']) - 1):
+        return {'poc': data['pocs'][index], 'value_area_low': data['value_area_lows'][index],
+                'value_area_high': data['value_area_highs'][index]}
+    return {key: data[key] for key in VolumeProfileValue.__annotations__}
+
+
+def is_causal(tool: ToolBase) -> bool:
+    # A Fixed profile is binned on the range of every bar, later ones included
+    if isinstance(tool, VolumeProfile):
+        return tool.mode != 'Fixed'
+    return type(tool).__name__ in CAUSAL_TOOLS
+
+
+def is_close(value, expected, rtol=1e-9) -> bool:
+    if isinstance(expected, dict):
+        return all(is_close(value[key], expected[key], rtol) for key in expected)
+    if isinstance(expected, (list, tuple)) or (isinstance(expected, np.ndarray) and expected.ndim):
+        return len(value) == len(expected) and all(is_close(a, b, rtol) for a, b in zip(value, expected))
+    if isinstance(expected, (float, np.floating)) and not isinstance(expected, bool):
+        return bool(np.isclose(value, expected, rtol=rtol, equal_nan=True))
+    return value == expected
+
+
+def check_streaming_equivalence(make_tool: Callable[[], ToolBase], bars: Bars, checkpoints=50) -> List[int]:
+    """
+    Feeds bars one by one into a fresh tool and returns the indices where
+    update disagrees with calculate_historical_data. Every bar is compared with
+    the full-history output for causal tools, and at `checkpoints` evenly
+    spaced bars update must match the last value computed over that prefix.
+    """
+    bars = BarSeries.coerce(bars)
+    streaming_tool = make_tool()
+    tool_name = type(streaming_tool).__name__
+    value_at = VALUE_AT[tool_name]
+    full_history = make_tool().calculate_historical_data(
+        bars) if is_causal(streaming_tool) else None
+    checked = set(np.linspace(0, len(bars) - 1, checkpoints).astype(int).tolist())
+    mismatches = []
+    for index, bar in enumerate(bars.to_bar_dicts()):
+        latest = streaming_tool.update(bar)
+        is_match = full_history is None or is_close(
+            latest, value_at(full_history, index))
+        if is_match and index in checked:
+            prefix_history = make_tool().calculate_historical_data(
+                bars[:index + 1])
+            is_match = is_close(latest, value_at(prefix_history, -1))
+        if not is_match:
+            mismatches.append(index)
+    return mismatches
+
+
+TOOLS: Dict[str, Callable[[], ToolBase]] = {
+    'Range': PotentialRange,
+    'Ichimoku': Ichimoku,
+    'FibonacciRetracement': FibonacciRetracement,
+    'FibonacciRetracement Rolling': lambda: FibonacciRetracement(FibonacciRetracementConfig(lookback=500)),
+    'MARibbon SMA': MARibbon,
+    'MARibbon EMA': lambda: MARibbon(MARibbonConfig(ma_type='EMA')),
+    'MARibbon WMA': lambda: MARibbon(MARibbonConfig(ma_type='WMA')),
+    'VolumeProfile': VolumeProfile,
+    'VolumeProfile Rolling': lambda: VolumeProfile(VolumeProfileConfig(mode='Rolling')),
+    'VolumeProfile Session': lambda: VolumeProfile(VolumeProfileConfig(mode='Session', session='4h')),
+}
+
+
+@pytest.mark.parametrize('tool_name', TOOLS)
+def test_streaming_equivalence(tool_name):
+    mismatches = check_streaming_equivalence(TOOLS[tool_name], generate_bars(5000))
+    assert not mismatches, f"{len(mismatches)} mismatches, first at bar {mismatches[0]}"
@@ -0,0 +1,38 @@
+"""Walk-forward test segments, stitched, against the full history run."""
+from synthetic_bars import generate_bars
+from bar_store import BarStore
+from resampler import resample_into_store
+from backtest import BacktestConfig, run_backtest
+from strategies import Strategy1
+from walk_forward import WalkForwardJob, get_windows, run_walk_forward, stitch
+import numpy as np
+import pytest
+
+
+def test_get_windows_rejects_overlapping_test_segments():
+    with pytest.raises(ValueError):
+        get_windows(10000, 1000, 500, step=400)
+
+
+def test_stitched_run_is_full_history_run(tmp_path):
+    """
+    The stitched test segments have the full history run's positions, and
+    the equity and trades of one backtest of the full history signals from
+    the first test bar on.
+    """
+    config = BacktestConfig()
+    store = BarStore(str(tmp_path))
+    store.write('BTC', '15m', generate_bars(30000, interval_seconds=15 * 60))
+    resample_into_store(store, 'BTC', '1H', '15m', full=True)
+    bars = (store.read('BTC', '15m'), store.read('BTC', '1H'))
+    signals = Strategy1(config=config).get_signals(*bars)
+    full = run_backtest(bars[0], signals, config)
+    windows = get_windows(len(bars[0]), 5000, 2000)
+    job = WalkForwardJob('BTC', '15m', '1H', str(tmp_path), config)
+    stitched = stitch(list(run_walk_forward(job, windows, workers=1)), bars[0], config)
+    start, end = windows[0].test_start, windows[-1].test_end
+    expected = run_backtest(bars[0][start:end], signals[start:end], config, signals[start - 1])
+    assert np.array_equal(stitched.positions, full.positions[start:end])
+    assert np.array_equal(stitched.positions, expected.positions)
+    assert np.array_equal(stitched.equity, expected.equity)
+    assert stitched.trades == expected.trades